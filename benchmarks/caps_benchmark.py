@@ -0,0 +1,124 @@
+"""
+Benchmark suite for the :type:`Caps` codec
+
+Runs serialize, parse, lazy parse and round-trip over the packet corpus in ``corpus.py`` and reports
+operations per second, bytes per second and memory allocated per packet. Results can be saved as JSON
+and compared against an earlier run, so codec regressions are caught before a release:
+
+    python benchmarks/caps_benchmark.py --output before.json
+    python benchmarks/caps_benchmark.py --compare before.json
+"""
+from __future__ import annotations
+import argparse, dataclasses, json, platform, sys, time, tracemalloc
+
+import corpus
+from loader import LIBCAPS_PATH, loadLibcaps
+
+def operations(Caps, caps) -> dict:
+	"""Return the benchmarked operations for one packet, as name -> callable"""
+	data = caps.serialize()
+	# The corpus nests deeper than the default limit, a libcaps.py from before CapsLimits takes no limits
+	options = {}
+	if hasattr(Caps, 'DEFAULT_LIMITS'):
+		options['limits'] = dataclasses.replace(Caps.DEFAULT_LIMITS, maxDepth=corpus.MAX_DEPTH + 1)
+	ops = {
+		'serialize': caps.serialize,
+		'parse': lambda: Caps.fromBytes(data, **options),
+		'round_trip': lambda: Caps.fromBytes(caps.serialize(), **options)[0].serialize(),
+	}
+	if hasattr(Caps, 'fromBytesLazy'):
+		ops['parse_lazy_first'] = lambda: Caps.fromBytesLazy(data, **options)[0].at(0)
+	return ops
+
+def measure(function, minTime: float, repeat: int = 3) -> tuple[float, int]:
+	"""Return (seconds per call, calls), the best of repeat runs that each take at least minTime seconds"""
+	number = 1
+	while True:
+		start = time.perf_counter()
+		for _ in range(number):
+			function()
+		elapsed = time.perf_counter() - start
+		if elapsed >= minTime:
+			break
+		number *= 2 if elapsed <= 0 else max(2, min(10, int(minTime / elapsed) + 1))
+	best = elapsed
+	for _ in range(repeat - 1):
+		start = time.perf_counter()
+		for _ in range(number):
+			function()
+		best = min(best, time.perf_counter() - start)
+	return best / number, number * repeat
+
+def allocations(function, calls: int = 20) -> tuple[float, float]:
+	"""Return (blocks, bytes) allocated per call that are still alive when the call returns, and the peak bytes per call"""
+	function() # warm up caches
+	results = []
+	tracemalloc.start()
+	try:
+		before = tracemalloc.take_snapshot()
+		tracemalloc.reset_peak() if hasattr(tracemalloc, 'reset_peak') else None
+		for _ in range(calls):
+			results.append(function())
+		after = tracemalloc.take_snapshot()
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+	return blocks / calls, peak / calls
+
+def run(Caps, minTime: float) -> dict:
+	results = {}
+	for name, caps in corpus.build(Caps).items():
+		size = len(caps.serialize())
+		for op, function in operations(Caps, caps).items():
+			seconds, calls = measure(function, minTime)
+			blocks, peak = allocations(function)
+			results['%s/%s' % (name, op)] = {
+				'packet_bytes': size,
+				'ops_per_sec': 1 / seconds,
+				'bytes_per_sec': size / seconds,
+				'alloc_blocks_per_packet': blocks,
+				'peak_alloc_bytes_per_packet': peak,
+				'calls': calls,
+			}
+	return results
+
+def main() -> int:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--libcaps', default=LIBCAPS_PATH, help='libcaps.py to benchmark, defaults to the one in this tree')
+	parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds to time every operation')
+	parser.add_argument('--output', help='save the results as JSON to this file')
+	parser.add_argument('--compare', help='earlier JSON results to compare against')
+	parser.add_argument('--threshold', type=float, default=0.8, help='fail when ops/sec drops below this ratio of --compare')
+	args = parser.parse_args()
+
+	results = run(loadLibcaps(args.libcaps, 'libcaps_bench').Caps, args.min_time)
+	previous = json.load(open(args.compare))['results'] if args.compare else {}
+
+	regressions = []
+	print('%-40s %8s %12s %12s %10s %12s' % ('benchmark', 'bytes', 'ops/s', 'MB/s', 'blocks/pkt', 'peak B/pkt') + ('  %7s' % 'ratio' if previous else ''))
+	for name, result in results.items():
+		line = '%-40s %8d %12.0f %12.2f %10.1f %12.0f' % (name, result['packet_bytes'], result['ops_per_sec'], result['bytes_per_sec'] / 1e6, result['alloc_blocks_per_packet'], result['peak_alloc_bytes_per_packet'])
+		if name in previous:
+			ratio = result['ops_per_sec'] / previous[name]['ops_per_sec']
+			line += '  x%6.2f' % ratio
+			if ratio < args.threshold:
+				line += '  REGRESSION'
+				regressions.append(name)
+		print(line)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump({
+				'python': sys.version,
+				'platform': platform.platform(),
+				'time': time.time(),
+				'results': results,
+			}, f, indent=2)
+	if regressions:
+		print('%d benchmark(s) slower than x%.2f of %s' % (len(regressions), args.threshold, args.compare))
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
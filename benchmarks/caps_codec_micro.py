@@ -0,0 +1,81 @@
+"""
+Microbenchmark for the :type:`Caps` member codec
+
+Measures encode (serialize) and decode (fromBytes) operations per second on a few representative packets.
+Pass ``--baseline`` with the path to another libcaps.py to compare against it, for example an older release:
+
+    git show v0.0.4a2:src/pyrokid_cxr_clientm/libcaps.py > /tmp/libcaps_old.py
+    python benchmarks/caps_codec_micro.py --baseline /tmp/libcaps_old.py
+"""
+import argparse, os, timeit
+
+from loader import LIBCAPS_PATH, loadLibcaps
+
+def packets(Caps) -> dict:
+	"""Build the representative packets with the given Caps class"""
+	auth = Caps()
+	auth.writeUInt32(0x1004)
+	auth.writeUInt32(1)
+	auth.writeUInt32(5)
+	auth.write('TestDevice')
+	auth.writeUInt64(1765983621057)
+
+	info = Caps()
+	info.writeString('xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx')
+	info.writeString('MA:C0:AD:DR:ES:SS')
+	info.writeString('x' * 82 + '==')
+	info.writeUInt32(1)
+	info.writeUInt32(1)
+
+	args = Caps()
+	args.writeInt32(87)
+	args.writeBoolean(True)
+	args.writeFloat(0.5)
+	args.writeDouble(1765983621.057)
+	notify = Caps()
+	notify.writeUInt32(0x1003)
+	notify.writeString('battery_level')
+	notify.writeObject(args)
+
+	photo = Caps()
+	photo.writeUInt32(0x1002)
+	photo.writeUInt32(42)
+	photo.writeBinary(os.urandom(64 * 1024))
+
+	# Large payloads take another encode path, check those don't regress either
+	largePhoto = Caps()
+	largePhoto.writeUInt32(0x1002)
+	largePhoto.writeUInt32(43)
+	largePhoto.writeBinary(os.urandom(2 * 1024 * 1024))
+
+	return {'auth': auth, 'connection_info': info, 'notify': notify, 'photo_64k': photo, 'photo_2m': largePhoto}
+
+def bench(Caps, repeat: int) -> dict:
+	results = {}
+	for name, caps in packets(Caps).items():
+		data = caps.serialize()
+		number = max(1, repeat // (1 + len(data) // 1024))
+		encode = min(timeit.repeat(caps.serialize, number=number, repeat=3)) / number
+		decode = min(timeit.repeat(lambda: Caps.fromBytes(data), number=number, repeat=3)) / number
+		results[name] = (1 / encode, 1 / decode)
+	return results
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--baseline', help='path to another libcaps.py to compare against')
+	parser.add_argument('--repeat', type=int, default=20000, help='operations per timing run for small packets')
+	args = parser.parse_args()
+
+	current = bench(loadLibcaps(LIBCAPS_PATH, 'libcaps_current').Caps, args.repeat)
+	baseline = bench(loadLibcaps(args.baseline, 'libcaps_baseline').Caps, args.repeat) if args.baseline else None
+
+	print('%-16s %14s %14s' % ('packet', 'encode ops/s', 'decode ops/s') + ('  %14s %14s' % ('base encode', 'base decode') if baseline else ''))
+	for name, (encode, decode) in current.items():
+		line = '%-16s %14.0f %14.0f' % (name, encode, decode)
+		if baseline:
+			baseEncode, baseDecode = baseline[name]
+			line += '  %14.0f %14.0f  (x%.2f encode, x%.2f decode)' % (baseEncode, baseDecode, encode / baseEncode, decode / baseDecode)
+		print(line)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,58 @@
+"""
+Benchmark for the bulk LEB128 array helpers of :type:`Caps`
+
+Encodes and decodes timestamp-like INT64 series of 1k to 1M values with writeInt64Array/readInt64Array,
+once with numpy and once with the pure python fallback, next to writing every value with writeInt64.
+"""
+from __future__ import annotations
+import argparse, random, time
+
+from loader import loadLibcaps
+
+def timed(function) -> float:
+	start = time.perf_counter()
+	function()
+	return time.perf_counter() - start
+
+def series(count: int) -> list[int]:
+	"""Millisecond timestamps with some jitter, like a sensor series"""
+	value = 1765983621057
+	values = []
+	for _ in range(count):
+		value += random.randint(-5, 40)
+		values.append(value)
+	return values
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+	parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+	args = parser.parse_args()
+
+	libcaps = loadLibcaps()
+	Caps = libcaps.Caps
+	numpy = libcaps.numpy
+	modes = [('numpy', numpy), ('python', None)] if numpy is not None else [('python', None)]
+
+	print('%-9s %-8s %14s %14s' % ('values', 'mode', 'encode val/s', 'decode val/s'))
+	for count in args.sizes:
+		values = series(count)
+
+		# Disable bulk runs for the per-member baseline
+		libcaps._BULK_MIN_RUN, minRun = count + 1, libcaps._BULK_MIN_RUN
+		caps = Caps()
+		encode = timed(lambda: [caps.writeInt64(value) for value in values] and caps.serialize())
+		data = caps.serialize()
+		decode = timed(lambda: Caps.fromBytes(data)[0].readInt64Array())
+		libcaps._BULK_MIN_RUN = minRun
+		print('%-9d %-8s %14.0f %14.0f' % (count, 'member', count / encode, count / decode))
+
+		for name, module in modes:
+			libcaps.numpy = module
+			encode = timed(lambda: Caps().writeInt64Array(values).serialize())
+			decode = timed(lambda: Caps.fromBytes(data)[0].readInt64Array())
+			assert Caps.fromBytes(data)[0].readInt64Array() == values
+			print('%-9d %-8s %14.0f %14.0f' % (count, name, count / encode, count / decode))
+		libcaps.numpy = numpy
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,91 @@
+"""
+Packet corpus for the :type:`Caps` benchmarks
+
+The shapes follow packets seen in the protocol. Every builder takes the Caps class to use,
+so the same corpus can be built with another libcaps.py for comparisons.
+"""
+import random
+
+def authRequest(Caps):
+	"""AUTH_REQUEST as sent by the phone, from the README example"""
+	caps = Caps()
+	caps.writeUInt32(0x1004)
+	caps.writeUInt32(1)
+	caps.writeUInt32(5)
+	caps.write('TestDevice')
+	caps.writeUInt64(1765983621057)
+	return caps
+
+def connectionInfo(Caps):
+	"""Connection info response, same shape as the README sample"""
+	caps = Caps()
+	caps.writeString('xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx') # socketUuid
+	caps.writeString('MA:C0:AD:DR:ES:SS') # macAddress
+	caps.writeString('x' * 82 + '==') # rokidAccount
+	caps.writeUInt32(1) # glassesType
+	caps.writeUInt32(1)
+	return caps
+
+def notifyBattery(Caps):
+	"""NOTIFY with a small nested argument object"""
+	args = Caps()
+	args.writeInt32(87)
+	args.writeBoolean(True)
+	caps = Caps()
+	caps.writeUInt32(0x1003)
+	caps.writeString('battery_level')
+	caps.writeObject(args)
+	return caps
+
+def notifySceneStatus(Caps):
+	"""NOTIFY with a wider argument object, like a scene status update"""
+	args = Caps()
+	for scene in ('ai_chat', 'translate', 'audio_record', 'video_record', 'word_tips', 'navigation'):
+		args.writeString(scene)
+		args.writeBoolean(scene == 'translate')
+	args.writeDouble(1765983621.057)
+	args.writeFloat(0.75)
+	caps = Caps()
+	caps.writeUInt32(0x1003)
+	caps.writeString('scene_status')
+	caps.writeObject(args)
+	return caps
+
+def photo(Caps, size: int):
+	"""RESPONSE carrying a binary photo payload"""
+	caps = Caps()
+	caps.writeUInt32(0x1002)
+	caps.writeUInt32(42)
+	caps.writeString('/storage/emulated/0/DCIM/Camera/IMG_20251217_153021.jpg')
+	caps.writeBinary(random.Random(size).randbytes(size) if hasattr(random.Random, 'randbytes') else bytes(size))
+	return caps
+
+MAX_DEPTH = 64
+"""Deepest nesting in the corpus, deeper than the default :attr:`CapsLimits.maxDepth`"""
+
+def nested(Caps, depth: int):
+	"""Objects nested depth levels deep, with a couple of members on every level"""
+	caps = Caps()
+	caps.writeUInt32(depth)
+	caps.writeString('leaf')
+	for level in range(depth):
+		parent = Caps()
+		parent.writeUInt32(level)
+		parent.writeString('level')
+		parent.writeObject(caps)
+		caps = parent
+	return caps
+
+def build(Caps) -> dict:
+	"""Return the whole corpus as name -> Caps"""
+	return {
+		'auth_request': authRequest(Caps),
+		'connection_info': connectionInfo(Caps),
+		'notify_battery': notifyBattery(Caps),
+		'notify_scene_status': notifySceneStatus(Caps),
+		'photo_64k': photo(Caps, 64 * 1024),
+		'photo_2m': photo(Caps, 2 * 1024 * 1024),
+		'nested_depth_4': nested(Caps, 4),
+		'nested_depth_16': nested(Caps, 16),
+		'nested_depth_64': nested(Caps, MAX_DEPTH),
+	}
@@ -0,0 +1,17 @@
+"""
+Loads libcaps.py for the :type:`Caps` benchmarks
+
+The module is loaded straight from its file, without importing the whole package,
+so a libcaps.py from another release can be benchmarked next to the one in this tree.
+"""
+import importlib.util, os, sys
+
+LIBCAPS_PATH = os.path.join(os.path.dirname(__file__), '..', 'src', 'pyrokid_cxr_clientm', 'libcaps.py')
+
+def loadLibcaps(path: str = LIBCAPS_PATH, name: str = 'libcaps'):
+	"""Load a libcaps.py file as a module called name, use another name for every file that is loaded"""
+	spec = importlib.util.spec_from_file_location(name, path)
+	module = importlib.util.module_from_spec(spec)
+	sys.modules[spec.name] = module # dataclasses look their module up while it is being executed
+	spec.loader.exec_module(module)
+	return module
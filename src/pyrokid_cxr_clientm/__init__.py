@@ -5,12 +5,16 @@ A python port of the com.rokid.cxr.client-m Java library.
 The idea is to allow you to use the CXR-M SDK on any device with bluetooth.
 """
 
-__all__ = ['controllers', 'extend', 'utils', 'Caps', 'CXRSocketProtocol', 'PacketTypeIds']
+__all__ = ['controllers', 'extend', 'utils', 'ArtcFrame', 'ArtcFramePipeline', 'AudioRingBuffer', 'AudioStreamSink', 'Caps', 'CapsLimits', 'CapsSchema', 'CapsStreamDecoder', 'CapsTemplate', 'CXRSocketProtocol', 'CXRSendScheduler', 'CXRPacketRouter', 'DropPolicy', 'FrameBufferPool', 'JitterBuffer', 'OrderedExecutor', 'PacketTypeIds', 'TrafficClass']
 from ._version import __version__
 __author__ = 'Miniontoby'
 
 #from .controllers import *
 from .extend import *
 from .utils import *
-from .libcaps import Caps
-from .cxr_socket_protocol import CXRSocketProtocol, PacketTypeIds
+from .libcaps import Caps, CapsLimits, CapsStreamDecoder, CapsTemplate
+from .caps_schema import CapsSchema
+from .cxr_socket_protocol import CXRSocketProtocol, CXRSendScheduler, PacketTypeIds, TrafficClass
+from .packet_router import CXRPacketRouter, OrderedExecutor
+from .audio_buffer import AudioRingBuffer, AudioStreamSink, JitterBuffer
+from .artc_pipeline import ArtcFrame, ArtcFramePipeline, DropPolicy, FrameBufferPool
@@ -0,0 +1,191 @@
+from __future__ import annotations
+from collections import deque
+from enum import IntEnum
+from threading import Condition, Lock
+from .extend.listeners import ArtcListener
+
+class DropPolicy(IntEnum):
+	"""What :class:`ArtcFramePipeline` does with a frame when its queue is full"""
+	DROP_OLDEST = 0 # drop the oldest queued frame, so the consumer always gets the freshest frames
+	DROP_NEWEST = 1 # drop the new frame, so the consumer gets every frame up to the moment it fell behind
+
+class ArtcFrame:
+	"""A frame in a pooled buffer, call :func:`ArtcFrame.release` when done with it so the buffer can be reused"""
+	__slots__ = ('buffer', 'length', 'sequence', '_pool')
+
+	def __init__(self, buffer: bytearray, length: int, sequence: int, pool: FrameBufferPool):
+		self.buffer = buffer
+		"""The buffer the frame is in, it can be larger than the frame"""
+		self.length = length
+		"""Size of the frame in bytes"""
+		self.sequence = sequence
+		"""Number of the frame in the order it was received"""
+		self._pool = pool
+
+	@property
+	def data(self) -> memoryview:
+		"""The frame data, valid until the frame is released"""
+		return memoryview(self.buffer)[:self.length]
+
+	def release(self) -> None:
+		"""Give the buffer back to the pool"""
+		if self._pool is not None:
+			self._pool.release(self.buffer)
+			self._pool = None
+
+class FrameBufferPool:
+	"""Pool of preallocated frame buffers
+
+	:param int bufferSize: Size of each buffer, larger frames get a buffer of their own that isn't pooled
+	:param int count: Number of buffers to allocate up front, the pool grows when more are in use at once
+	"""
+
+	def __init__(self, bufferSize: int, count: int):
+		self.bufferSize = bufferSize
+		"""Size of each buffer"""
+		self.allocated = count
+		"""Number of buffers the pool allocated"""
+		self.oversized = 0
+		"""Number of frames that didn't fit in a pooled buffer"""
+		self.__free = [bytearray(bufferSize) for _ in range(count)]
+		self.__lock = Lock()
+
+	def acquire(self, size: int) -> bytearray:
+		"""Return a buffer of at least size bytes"""
+		if size > self.bufferSize:
+			self.oversized += 1
+			return bytearray(size)
+		with self.__lock:
+			if self.__free:
+				return self.__free.pop()
+			self.allocated += 1
+		return bytearray(self.bufferSize)
+
+	def release(self, buffer: bytearray) -> None:
+		"""Give a buffer from :func:`FrameBufferPool.acquire` back"""
+		if len(buffer) == self.bufferSize:
+			with self.__lock:
+				self.__free.append(buffer)
+
+class ArtcFramePipeline(ArtcListener):
+	"""Bounded queue of ARTC frames between the connection and a slower consumer, like an encoder, display or network relay
+
+	Received frames are copied into buffers of a :class:`FrameBufferPool` and queued. When the consumer falls behind,
+	the queue never grows past ``maxFrames``, a frame is dropped by the :class:`DropPolicy` instead. So memory stays bounded by
+	the queue and the pool, and with ``DROP_OLDEST`` the consumer always gets the freshest frames.
+
+	Frames are put in with :func:`ArtcFramePipeline.onArtsFrame` (so the pipeline can be added to a :class:`CXRPacketRouter`)
+	or :func:`ArtcFramePipeline.put`, and taken out with :func:`ArtcFramePipeline.get`.
+
+	Example::
+
+		pipeline = ArtcFramePipeline(maxFrames=3)
+		router.addListener(pipeline)
+		while True:
+			frame = pipeline.get()
+			if frame is None:
+				break
+			encoder.encode(frame.data)
+			frame.release()
+
+	:param int maxFrames: Number of frames the queue holds
+	:param DropPolicy policy: Which frame to drop when the queue is full
+	:param int bufferSize: Size of the pooled buffers, the largest expected frame
+	"""
+
+	def __init__(self, maxFrames: int = 4, policy: DropPolicy = DropPolicy.DROP_OLDEST, bufferSize: int = 128 * 1024):
+		self.maxFrames = maxFrames
+		"""Number of frames the queue holds"""
+		self.policy = policy
+		"""Which frame to drop when the queue is full"""
+		# Queued frames, one being consumed and one being copied in
+		self.pool = FrameBufferPool(bufferSize, maxFrames + 2)
+		"""The pool the frame buffers come from"""
+		self.received = 0
+		"""Number of frames put in"""
+		self.delivered = 0
+		"""Number of frames taken out"""
+		self.dropped = 0
+		"""Number of frames dropped because the queue was full"""
+		self.maxDepth = 0
+		"""Highest number of queued frames"""
+		self.__queue = deque()
+		self.__condition = Condition()
+		self.__closed = False
+
+	def put(self, data: bytes) -> bool:
+		"""Queue a copy of a frame, never blocks
+
+		:returns: False when this frame was dropped
+		"""
+		buffer = self.pool.acquire(len(data))
+		buffer[:len(data)] = data
+		with self.__condition:
+			frame = ArtcFrame(buffer, len(data), self.received, self.pool)
+			self.received += 1
+			if self.__closed:
+				frame.release()
+				return False
+			if len(self.__queue) >= self.maxFrames:
+				self.dropped += 1
+				if self.policy == DropPolicy.DROP_NEWEST:
+					frame.release()
+					return False
+				self.__queue.popleft().release()
+			self.__queue.append(frame)
+			self.maxDepth = max(self.maxDepth, len(self.__queue))
+			self.__condition.notify()
+		return True
+
+	def get(self, timeout: float = None) -> ArtcFrame:
+		"""Take the next frame out, waiting for one when the queue is empty
+
+		:param Optional[float] timeout: Seconds to wait, None waits until a frame arrives or the pipeline is closed
+		:returns: The frame, or None on a timeout or when the pipeline is closed
+		"""
+		with self.__condition:
+			if not self.__condition.wait_for(lambda: self.__queue or self.__closed, timeout) or not self.__queue:
+				return None
+			self.delivered += 1
+			return self.__queue.popleft()
+
+	def depth(self) -> int:
+		"""Return the number of queued frames"""
+		with self.__condition:
+			return len(self.__queue)
+
+	def clear(self) -> None:
+		"""Drop the queued frames"""
+		with self.__condition:
+			while self.__queue:
+				self.__queue.popleft().release()
+
+	def close(self) -> None:
+		"""Drop the queued frames and wake up the consumers, :func:`ArtcFramePipeline.get` returns None from now on"""
+		with self.__condition:
+			self.__closed = True
+			while self.__queue:
+				self.__queue.popleft().release()
+			self.__condition.notify_all()
+
+	def stats(self) -> dict:
+		"""Return the pipeline counters"""
+		with self.__condition:
+			return {
+				'received': self.received,
+				'delivered': self.delivered,
+				'dropped': self.dropped,
+				'depth': len(self.__queue),
+				'maxDepth': self.maxDepth,
+				'buffers': self.pool.allocated,
+				'oversized': self.pool.oversized,
+			}
+
+	def onArtcStart(self) -> None:
+		pass
+
+	def onArtcStop(self) -> None:
+		self.clear()
+
+	def onArtsFrame(self, frame: bytes) -> None:
+		self.put(frame)
@@ -0,0 +1,288 @@
+from __future__ import annotations
+from threading import Lock
+import time
+from .extend.listeners import AudioStreamListener
+
+class AudioRingBuffer:
+	"""Byte ring buffer of a fixed size, allocated once
+
+	Reads are :type:`memoryview` slices of the ring, so audio is only copied once: when it's written.
+	Written data never overwrites data that wasn't consumed yet, when there's no room the write is dropped and counted as an overrun.
+	Safe to write from one thread while another thread reads.
+
+	:param int capacity: Size of the ring in bytes
+	"""
+
+	def __init__(self, capacity: int):
+		self.capacity = capacity
+		"""Size of the ring in bytes"""
+		self.overruns = 0
+		"""Number of writes that were dropped because the ring was full"""
+		self.underruns = 0
+		"""Number of reads that wanted more bytes than were available"""
+		self.__buffer = bytearray(capacity)
+		self.__view = memoryview(self.__buffer)
+		self.__lock = Lock()
+		self.__read = 0
+		self.__written = 0
+
+	def __len__(self) -> int:
+		"""Return the number of bytes that can be read"""
+		return self.__written - self.__read
+
+	def write(self, data: bytes) -> bool:
+		"""Copy data into the ring
+
+		:returns: False when there wasn't room for all of data, then nothing is written
+		"""
+		size = len(data)
+		with self.__lock:
+			if size > self.capacity - (self.__written - self.__read):
+				self.overruns += 1
+				return False
+			data = memoryview(data)
+			start = self.__written % self.capacity
+			first = min(size, self.capacity - start)
+			self.__view[start:start + first] = data[:first]
+			self.__view[:size - first] = data[first:]
+			self.__written += size
+		return True
+
+	def peek(self, size: int) -> memoryview:
+		"""Return up to size bytes from the ring without copying or consuming them
+
+		The view is shorter than size when less is available, or when the data wraps around the end of the ring,
+		in which case the rest is returned by the next peek after :func:`AudioRingBuffer.consume`.
+		The view stays valid until it's consumed.
+		"""
+		with self.__lock:
+			available = self.__written - self.__read
+			if available < size:
+				self.underruns += 1
+			start = self.__read % self.capacity
+			return self.__view[start:start + min(size, available, self.capacity - start)]
+
+	def consume(self, size: int) -> None:
+		"""Mark size bytes as read, so they can be overwritten"""
+		with self.__lock:
+			self.__read += min(size, self.__written - self.__read)
+
+	def readInto(self, buffer: bytearray) -> int:
+		"""Copy up to ``len(buffer)`` bytes into buffer and consume them, returns the number of bytes copied"""
+		target = memoryview(buffer)
+		with self.__lock:
+			available = self.__written - self.__read
+			if available < len(target):
+				self.underruns += 1
+			size = min(len(target), available)
+			start = self.__read % self.capacity
+			first = min(size, self.capacity - start)
+			target[:first] = self.__view[start:start + first]
+			target[first:size] = self.__view[:size - first]
+			self.__read += size
+		return size
+
+	def clear(self) -> None:
+		"""Drop all data in the ring"""
+		with self.__lock:
+			self.__read = self.__written
+
+class JitterBuffer:
+	"""Reorders audio packets by their sequence number and releases them at a steady pace
+
+	The first packet is released ``delay`` seconds after it arrived, and every next sequence number ``packetDuration`` later,
+	so packets that arrive late or out of order by less than ``delay`` are still played out in order and on time.
+	A packet that isn't there when its turn comes is skipped and counted as lost.
+	When the buffer runs dry the pace is reset, and the next packet starts a new ``delay``.
+	A packet ``maxPackets`` or more ahead, for example after the glasses restarted the stream, drops the buffered packets and starts over from that packet.
+
+	Packets are stored in ``maxPackets`` preallocated slots of ``slotSize`` bytes, the slot of a packet is its sequence number modulo ``maxPackets``.
+
+	:param float delay: Seconds between the arrival of the first packet and its release
+	:param float packetDuration: Seconds of audio per packet
+	:param int maxPackets: Number of packets that can be buffered
+	:param int slotSize: Maximum size of a packet in bytes
+	"""
+
+	def __init__(self, delay: float = 0.06, packetDuration: float = 0.02, maxPackets: int = 16, slotSize: int = 4096):
+		self.delay = delay
+		"""Seconds between the arrival of the first packet and its release"""
+		self.packetDuration = packetDuration
+		"""Seconds of audio per packet"""
+		self.maxPackets = maxPackets
+		"""Number of packets that can be buffered"""
+		self.slotSize = slotSize
+		"""Maximum size of a packet in bytes"""
+		self.late = 0
+		"""Number of packets that arrived after their turn"""
+		self.lost = 0
+		"""Number of packets that weren't there at their turn"""
+		self.dropped = 0
+		"""Number of packets that were too large, or were buffered when a packet too far ahead started over"""
+		self.__slots = memoryview(bytearray(maxPackets * slotSize))
+		self.__lengths = [0] * maxPackets
+		self.__sequences = [None] * maxPackets
+		self.__buffered = 0
+		self.__next = None
+		self.__due = 0.0
+		self.__lock = Lock()
+
+	def __len__(self) -> int:
+		"""Return the number of buffered packets"""
+		return self.__buffered
+
+	def push(self, sequence: int, data: bytes, now: float = None) -> bool:
+		"""Add a received packet
+
+		:param int sequence: The UINT32 sequence number of the packet, it may wrap around
+		:param bytes data: The audio data, it's copied into a slot
+		:param Optional[float] now: The ``time.monotonic()`` arrival time
+		:returns: False when the packet was dropped
+		"""
+		if now is None:
+			now = time.monotonic()
+		if len(data) > self.slotSize:
+			self.dropped += 1
+			return False
+		with self.__lock:
+			if self.__next is None:
+				self.__next = sequence
+				self.__due = now + self.delay
+			ahead = (sequence - self.__next) & 0xFFFFFFFF
+			if ahead >= 0x80000000:
+				self.late += 1
+				return False
+			if ahead >= self.maxPackets:
+				# Too far ahead to wait for the packets in between, start over from this packet
+				self.dropped += self.__buffered
+				self.__sequences = [None] * self.maxPackets
+				self.__buffered = 0
+				self.__next = sequence
+				self.__due = now + self.delay
+			slot = sequence % self.maxPackets
+			if self.__sequences[slot] is None:
+				self.__buffered += 1
+			self.__sequences[slot] = sequence
+			self.__lengths[slot] = len(data)
+			start = slot * self.slotSize
+			self.__slots[start:start + len(data)] = data
+		return True
+
+	def __release(self) -> memoryview:
+		"""Advance to the next sequence number, returns the packet of the current one or None"""
+		slot = self.__next % self.maxPackets
+		packet = None
+		if self.__sequences[slot] == self.__next:
+			self.__sequences[slot] = None
+			self.__buffered -= 1
+			start = slot * self.slotSize
+			packet = self.__slots[start:start + self.__lengths[slot]]
+		self.__next = (self.__next + 1) & 0xFFFFFFFF
+		self.__due += self.packetDuration
+		return packet
+
+	def pop(self, now: float = None) -> bytes:
+		"""Return a copy of the next packet when it's due, or None"""
+		if now is None:
+			now = time.monotonic()
+		with self.__lock:
+			while self.__next is not None and now >= self.__due:
+				if not self.__buffered:
+					# Ran dry, start over with a new delay on the next packet
+					self.__next = None
+					return None
+				packet = self.__release()
+				if packet is not None:
+					# Copy while locked, a push can reuse the slot as soon as the lock is released
+					return bytes(packet)
+				self.lost += 1
+			return None
+
+	def reset(self) -> None:
+		"""Drop all buffered packets and start over on the next packet"""
+		with self.__lock:
+			self.__sequences = [None] * self.maxPackets
+			self.__buffered = 0
+			self.__next = None
+
+class AudioStreamSink(AudioStreamListener):
+	""":class:`AudioStreamListener` that collects the audio stream in an :class:`AudioRingBuffer`, optionally paced by a :class:`JitterBuffer`
+
+	Memory use is fixed by the sizes of both buffers, however long the stream runs. A consumer reads with :func:`AudioStreamSink.peek`
+	and :func:`AudioStreamSink.consume`, which also release the packets that became due.
+
+	Example::
+
+		sink = AudioStreamSink(jitter=JitterBuffer(delay=0.06, packetDuration=0.02))
+		router.addListener(sink)
+		...
+		view = sink.peek(3200)
+		recognizer.feed(view)
+		sink.consume(len(view))
+
+	:param int capacity: Size of the ring buffer in bytes
+	:param Optional[JitterBuffer] jitter: Reorder and pace the packets, without it packets go into the ring as they arrive
+	"""
+
+	def __init__(self, capacity: int = 256 * 1024, jitter: JitterBuffer = None):
+		self.ring = AudioRingBuffer(capacity)
+		"""The ring the audio ends up in"""
+		self.jitter = jitter
+		"""The jitter buffer in front of the ring, or None"""
+		self.streamType: int = None
+		"""The type from :func:`AudioStreamSink.onStartAudioStream`"""
+		self.streamName: str = None
+		"""The name from :func:`AudioStreamSink.onStartAudioStream`"""
+		self.__lock = Lock()
+
+	def onStartAudioStream(self, paramInt: int, paramString: str) -> None:
+		"""A new stream starts, buffered audio of the previous one is dropped"""
+		self.streamType = paramInt
+		self.streamName = paramString
+		if self.jitter is not None:
+			self.jitter.reset()
+		self.ring.clear()
+
+	def onAudioStream(self, paramArrayOfbyte: bytes, paramInt1: int, paramInt2: int) -> None:
+		"""Buffer an audio packet, paramInt2 is its sequence number (see ``AI_DATA`` in :class:`CXRSocketProtocol`)"""
+		if self.jitter is None:
+			self.ring.write(paramArrayOfbyte)
+		else:
+			self.jitter.push(paramInt2, paramArrayOfbyte)
+			self.poll()
+
+	def poll(self, now: float = None) -> None:
+		"""Move the packets that are due from the jitter buffer into the ring"""
+		if self.jitter is None:
+			return
+		with self.__lock:
+			while True:
+				packet = self.jitter.pop(now)
+				if packet is None:
+					break
+				self.ring.write(packet)
+
+	def peek(self, size: int) -> memoryview:
+		"""Return up to size bytes of audio without copying, see :func:`AudioRingBuffer.peek`"""
+		self.poll()
+		return self.ring.peek(size)
+
+	def consume(self, size: int) -> None:
+		"""Mark size bytes of audio as read"""
+		self.ring.consume(size)
+
+	def stats(self) -> dict:
+		"""Return the buffer counters"""
+		stats = {
+			'buffered': len(self.ring),
+			'overruns': self.ring.overruns,
+			'underruns': self.ring.underruns,
+		}
+		if self.jitter is not None:
+			stats.update({
+				'jitterPackets': len(self.jitter),
+				'late': self.jitter.late,
+				'lost': self.jitter.lost,
+				'dropped': self.jitter.dropped,
+			})
+		return stats
@@ -0,0 +1,258 @@
+"""
+Compiled :type:`Caps` schemas
+
+A schema declares the member layout of a message once, and compiles a specialized encoder and decoder for it,
+so a frame can be turned straight into a record instead of reading every member with ``caps.at(index)``.
+"""
+from __future__ import annotations
+from dataclasses import MISSING, fields, is_dataclass
+import keyword
+from .libcaps import Caps, CapsLimits, _UINT32_BE
+
+class CapsRecord:
+	"""Base class for the ``__slots__`` records that :type:`CapsSchema` generates when no record type is given"""
+	__slots__ = ()
+
+	def __repr__(self) -> str:
+		return "%s(%s)" % (type(self).__name__, ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+	def __eq__(self, other: object) -> bool:
+		if type(other) is not type(self):
+			return NotImplemented
+		return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+class CapsSchema:
+	"""Member layout of a message, with a compiled encoder and decoder
+
+	The descriptor table of a frame is compared to the schema in one comparison, so a frame with another layout fails
+	before any member gets decoded. The members are then read with straight-line code, without the per-member type dispatch of :func:`Caps.parse`.
+
+	Example::
+
+		ConnectionInfo = CapsSchema('ConnectionInfo', [
+			('socketUuid', Caps.Value.TYPE_STRING),
+			('macAddress', Caps.Value.TYPE_STRING),
+			('rokidAccount', Caps.Value.TYPE_STRING),
+			('glassesType', Caps.Value.TYPE_UINT32),
+			('unknown', Caps.Value.TYPE_UINT32),
+		])
+		info, rest = ConnectionInfo.decode(data)
+		print(info.socketUuid)
+
+	:param str name: Name of the message, also used for the generated record class
+	:param list[tuple[str, Any]] members: Ordered ``(name, type)`` pairs. The type is a ``Caps.Value.TYPE_*`` code,
+		:attr:`CapsSchema.BOOLEAN`, or another :type:`CapsSchema` for a nested object.
+		Names must be identifiers that aren't a keyword, ``self``, or start with ``__``, else a :type:`ValueError` is raised
+	:param Optional[type] record: Class to decode into, for example :type:`GlassInfo`. It gets called with the members as keyword arguments.
+		When not given a ``__slots__`` record class is generated, see :attr:`CapsSchema.record`
+	:param bool copyBinary: Materialize ``TYPE_BINARY`` members as :type:`bytes` instead of :type:`memoryview` slices of the frame
+	"""
+
+	BOOLEAN = 'boolean'
+	"""Member type for a boolean, it's sent as ``TYPE_UINT32`` just like :func:`Caps.writeBoolean`"""
+
+	class SchemaMismatchError(Caps.CapsError):
+		"""Exception that throws when a frame doesn't have the member layout of the :type:`CapsSchema`"""
+		pass
+
+	# Members of these types always take the same number of bytes
+	_FIXED_SIZES = {
+		Caps.Value.TYPE_VOID: 0,
+		Caps.Value.TYPE_FLOAT: 4,
+		Caps.Value.TYPE_DOUBLE: 8,
+	}
+
+	def __init__(self, name: str, members: list[tuple[str, Any]], record: type = None, copyBinary: bool = False):
+		self.name = name
+		"""Name of the message"""
+		self.members = list(members)
+		"""The ``(name, type)`` pairs of the members, in order"""
+		names = [member[0] for member in self.members]
+		for member_name in names:
+			# The names end up in generated code, as arguments next to self and as attributes that must not get name mangled
+			if not member_name.isidentifier() or keyword.iskeyword(member_name) or member_name == 'self' or member_name.startswith('__'):
+				raise ValueError("Invalid member name: %r" % (member_name))
+		if len(set(names)) != len(names):
+			raise ValueError("Duplicate member names in schema %s" % (name))
+		if record is None:
+			record = CapsSchema.__record_class(name, names)
+		elif is_dataclass(record):
+			unknown = set(names) - {field.name for field in fields(record)}
+			if unknown:
+				raise ValueError("%s has no fields named %s" % (record.__name__, ', '.join(sorted(unknown))))
+			missing = [field.name for field in fields(record) if field.init and field.name not in names and field.default is MISSING and field.default_factory is MISSING]
+			if missing:
+				raise ValueError("Schema %s has no members for the fields %s of %s" % (name, ', '.join(missing), record.__name__))
+		self.record = record
+		"""The class members get decoded into"""
+
+		types = bytes(CapsSchema.__wire_type(vType) for _, vType in self.members)
+		signature = bytearray(Caps._uleb128_size(len(types)))
+		Caps._write_uleb128(signature, 0, len(types))
+		self.signature = bytes(signature) + types
+		"""Member count and descriptor table every frame of this schema starts with, after the 5 byte header"""
+		self.__compile(copyBinary)
+
+	@staticmethod
+	def __wire_type(vType: Any) -> int:
+		if isinstance(vType, CapsSchema):
+			return Caps.Value.TYPE_OBJECT
+		if vType == CapsSchema.BOOLEAN:
+			return Caps.Value.TYPE_UINT32
+		if isinstance(vType, str):
+			vType = ord(vType)
+		if vType not in Caps._SIZERS:
+			raise ValueError("Unknown member type: %r" % (vType))
+		return vType
+
+	@staticmethod
+	def __record_class(name: str, names: list[str]) -> type:
+		"""Generate a ``__slots__`` record class with the member names as fields"""
+		source = "def __init__(self%s):\n\tpass\n" % (''.join(', ' + member_name for member_name in names))
+		for member_name in names:
+			source += "\tself.%s = %s\n" % (member_name, member_name)
+		namespace = {}
+		exec(source, namespace)
+		return type(name, (CapsRecord,), {'__slots__': tuple(names), '__init__': namespace['__init__']})
+
+	def __compile(self, copyBinary: bool) -> None:
+		"""Generate the size, write and read functions of this schema"""
+		readers = Caps._READERS_COPY if copyBinary else Caps._READERS
+		namespace = {
+			'Caps': Caps,
+			'CapsSchema': CapsSchema,
+			'name': self.name,
+			'record': self.record,
+			'signature': self.signature,
+			'pack_into': _UINT32_BE.pack_into,
+			'skip_object': Caps._skip_object,
+		}
+		header = 5 + len(self.signature)
+		fixed = header
+		size_terms = []
+		write_lines = []
+		read_lines = []
+		for index, (member_name, vType) in enumerate(self.members):
+			wire = CapsSchema.__wire_type(vType)
+			value = 'rec.%s' % (member_name)
+			if isinstance(vType, CapsSchema):
+				namespace['s%d' % index] = vType.__size
+				namespace['w%d' % index] = vType.__write
+				namespace['r%d' % index] = vType.__read
+				size_terms.append('s%d(%s)' % (index, value))
+				write_lines.append('offset = w%d(buffer, offset, %s)' % (index, value))
+				read_lines.append('v%d, offset = r%d(view, offset, end, readers)' % (index, index))
+				continue
+
+			if vType == CapsSchema.BOOLEAN:
+				value = 'int(%s)' % (value)
+			if wire in CapsSchema._FIXED_SIZES:
+				fixed += CapsSchema._FIXED_SIZES[wire]
+			else:
+				namespace['s%d' % index] = Caps._SIZERS[wire]
+				size_terms.append('s%d(%s)' % (index, value))
+			namespace['w%d' % index] = Caps._WRITERS[wire]
+			write_lines.append('offset = w%d(buffer, offset, %s)' % (index, value))
+			namespace['r%d' % index] = readers[wire]
+			if wire in (Caps.Value.TYPE_UINT32, Caps.Value.TYPE_UINT64):
+				# Single byte LEB128 values are decoded inline
+				read_lines.append('if offset < end and view[offset] < 0x80:')
+				read_lines.append('\tv%d = view[offset]' % (index))
+				read_lines.append('\toffset += 1')
+				read_lines.append('else:')
+				read_lines.append('\tv%d, offset = r%d(view, offset, end)' % (index, index))
+			elif wire in (Caps.Value.TYPE_INT32, Caps.Value.TYPE_INT64):
+				read_lines.append('if offset < end and view[offset] < 0x80:')
+				read_lines.append('\tv%d = view[offset] - ((view[offset] & 0x40) << 1)' % (index))
+				read_lines.append('\toffset += 1')
+				read_lines.append('else:')
+				read_lines.append('\tv%d, offset = r%d(view, offset, end)' % (index, index))
+			elif wire == Caps.Value.TYPE_BINARY:
+				read_lines.append('v%d, offset = readBinary(view, offset, end)' % (index))
+			else:
+				read_lines.append('v%d, offset = r%d(view, offset, end)' % (index, index))
+			if vType == CapsSchema.BOOLEAN:
+				read_lines.append('v%d = bool(v%d)' % (index, index))
+
+		has_binary = Caps.Value.TYPE_BINARY in self.signature[len(self.signature) - len(self.members):]
+		arguments = ', '.join('%s=v%d' % (member_name, index) for index, (member_name, _) in enumerate(self.members))
+		source = (
+			"def size(rec):\n"
+			"\treturn %s\n"
+			"def write(buffer, offset, rec):\n"
+			"\tstart = offset\n"
+			"\tbuffer[offset + 4] = %d\n"
+			"\tbuffer[offset + 5:offset + %d] = signature\n"
+			"\toffset += %d\n"
+			"%s"
+			"\tpack_into(buffer, start, offset - start)\n"
+			"\treturn offset\n"
+			"def read(view, offset, end, readers):\n"
+			"\tend = skip_object(view, offset, end)\n"
+			"\tif view[offset + 5:offset + %d] != signature:\n"
+			"\t\traise CapsSchema.SchemaMismatchError('%%s: expected members %%r, got %%r' %% (name, signature, bytes(view[offset + 5:offset + %d])))\n"
+			"\toffset += %d\n"
+			"%s"
+			"%s"
+			"\treturn record(%s), end\n"
+		) % (
+			' + '.join([str(fixed)] + size_terms),
+			Caps.CAPS_VERSION, header, header,
+			''.join('\t%s\n' % (line) for line in write_lines),
+			header, header, header,
+			"\treadBinary = readers[%d]\n" % (Caps.Value.TYPE_BINARY) if has_binary else '',
+			''.join('\t%s\n' % (line) for line in read_lines),
+			arguments,
+		)
+		exec(compile(source, '<CapsSchema %s>' % (self.name), 'exec'), namespace)
+		self.__size = namespace['size']
+		self.__write = namespace['write']
+		self.__read = namespace['read']
+		self.__copyBinary = copyBinary
+
+	def size(self, record: Any) -> int:
+		"""Return the exact number of bytes :func:`CapsSchema.encode` will produce for record"""
+		return self.__size(record)
+
+	def encode(self, record: Any) -> bytes:
+		"""Encode a record to a :type:`Caps` frame
+
+		:param Any record: An instance of :attr:`CapsSchema.record`, or any object with the member names as attributes
+		"""
+		buffer = bytearray(self.__size(record))
+		self.__write(buffer, 0, record)
+		return bytes(buffer)
+
+	def encodeInto(self, buffer: bytearray, offset: int, record: Any) -> int:
+		"""Encode a record into an existing buffer, like :func:`Caps.serializeInto`
+
+		:param bytearray buffer: The buffer to write into, a :type:`bytearray` gets extended when it's too small
+		:param int offset: The position in the buffer to start writing at
+		:param Any record: An instance of :attr:`CapsSchema.record`, or any object with the member names as attributes
+		:returns: The number of bytes written
+		"""
+		size = self.__size(record)
+		Caps._reserve(buffer, offset + size)
+		return self.__write(buffer, offset, record) - offset
+
+	def decode(self, data: bytes, limits: CapsLimits = None) -> tuple[Any, bytes]:
+		"""Decode a :type:`Caps` frame to a record
+
+		:param bytes data: The frame to decode, can be any bytes-like object
+		:param Optional[CapsLimits] limits: Limits for untrusted input, defaults to :attr:`Caps.DEFAULT_LIMITS`
+		:raises CapsSchema.SchemaMismatchError: When the frame has another member layout
+		:returns: The record and the bytes after the frame, like :func:`Caps.fromBytes`
+		"""
+		if limits is None:
+			limits = Caps.DEFAULT_LIMITS
+		view = memoryview(data)
+		size = Caps._parse_header(view, limits)
+		record, _ = self.__read(view, 0, size, Caps._readers(self.__copyBinary, limits, size))
+		return record, data[size:]
+
+	def matches(self, data: bytes) -> bool:
+		"""Return if the frame in data has the member layout of this schema, without decoding it"""
+		return bytes(memoryview(data)[5:5 + len(self.signature)]) == self.signature
+
+	def __repr__(self) -> str:
+		return "CapsSchema(%r, %r)" % (self.name, self.members)
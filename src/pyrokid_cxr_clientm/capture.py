@@ -0,0 +1,235 @@
+"""
+Offline analyzer for recorded :type:`Caps` traffic
+
+A capture file is the raw received byte stream, so a sequence of length-prefixed :type:`Caps` frames.
+The file is memory-mapped and only the 4 byte size prefixes are walked to split it into frame-aligned shards,
+which then get decoded in parallel by a process pool. Every worker maps the file itself, so no frame data is copied between processes.
+
+Usage::
+
+	python -m pyrokid_cxr_clientm.capture traffic.bin
+	python -m pyrokid_cxr_clientm.capture traffic.bin --jsonl --output traffic.jsonl
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import argparse, base64, json, math, mmap, os, sys, time, traceback
+from .libcaps import Caps, _UINT32_BE
+from .cxr_socket_protocol import PacketTypeIds
+
+DEFAULT_SHARD_SIZE = 16 * 1024 * 1024
+"""Amount of bytes of frames that one worker decodes at once"""
+
+@dataclass
+class PacketStats:
+	"""Statistics of one packet type in a capture"""
+	frames: int = 0
+	"""Number of frames"""
+	bytes: int = 0
+	"""Total size of the frames in bytes"""
+	minSize: int = 0
+	"""Size of the smallest frame"""
+	maxSize: int = 0
+	"""Size of the largest frame"""
+
+	def add(self, size: int) -> None:
+		"""Count one frame of size bytes"""
+		if not self.frames or size < self.minSize:
+			self.minSize = size
+		if size > self.maxSize:
+			self.maxSize = size
+		self.frames += 1
+		self.bytes += size
+
+	def merge(self, other: PacketStats) -> None:
+		"""Add the frames counted by other"""
+		if other.frames:
+			if not self.frames or other.minSize < self.minSize:
+				self.minSize = other.minSize
+			self.maxSize = max(self.maxSize, other.maxSize)
+			self.frames += other.frames
+			self.bytes += other.bytes
+
+@dataclass
+class CaptureResult:
+	"""Result of :func:`analyzeCapture`"""
+	stats: dict
+	""":type:`PacketStats` per packet type name"""
+	size: int
+	"""Size of the capture file in bytes"""
+	trailing: int
+	"""Amount of bytes at the end of the file that are not a complete frame"""
+	corruptOffset: int = None
+	"""Offset of a frame with an impossible size prefix, the rest of the file can't be framed. None when there is none"""
+
+def planShards(view: memoryview, shardSize: int = DEFAULT_SHARD_SIZE) -> tuple[list[tuple[int, int]], int, int]:
+	"""Split a capture into frame-aligned shards, by only reading the size prefixes
+
+	:param memoryview view: The capture data
+	:param int shardSize: Minimum amount of bytes per shard, the last shard can be smaller
+	:returns: The ``(start, end)`` shards, the offset after the last complete frame and the offset of a corrupt frame or None
+	"""
+	shards = []
+	length = len(view)
+	unpack_from = _UINT32_BE.unpack_from
+	start = offset = 0
+	corrupt = None
+	while offset + 4 <= length:
+		size = unpack_from(view, offset)[0]
+		if size < 5:
+			corrupt = offset
+			break
+		if offset + size > length:
+			break
+		offset += size
+		if offset - start >= shardSize:
+			shards.append((start, offset))
+			start = offset
+	if offset > start:
+		shards.append((start, offset))
+	return shards, offset, corrupt
+
+_TYPE_NAMES = {packetTypeId.value: packetTypeId.name for packetTypeId in PacketTypeIds}
+
+def packetType(caps: Caps) -> str:
+	"""Return the name of the :type:`PacketTypeIds` in the first member of a frame, or its hex value when it's not known"""
+	if not len(caps):
+		return 'UNKNOWN'
+	first = caps.at(0)
+	if first.type() != Caps.Value.TYPE_UINT32:
+		return 'UNKNOWN'
+	value = first.getValueNoType()
+	name = _TYPE_NAMES.get(value)
+	return '0x%04x' % (value) if name is None else name
+
+def _jsonMembers(caps: Caps) -> list:
+	"""Convert the members of a Caps to JSON compatible ``[type, value]`` pairs, binary data is base64 encoded and NaN or infinite floats are null"""
+	members = []
+	for index in range(len(caps)):
+		value = caps.at(index)
+		vType = value.type()
+		if vType == Caps.Value.TYPE_BINARY:
+			members.append(['B', base64.b64encode(value.getValueNoType()).decode('ascii')])
+		elif vType == Caps.Value.TYPE_OBJECT:
+			members.append(['O', _jsonMembers(value.getValueNoType())])
+		elif vType in (Caps.Value.TYPE_FLOAT, Caps.Value.TYPE_DOUBLE) and not math.isfinite(value.getValueNoType()):
+			# json.dumps would write NaN or Infinity, which strict JSON parsers reject
+			members.append([chr(vType), None])
+		else:
+			members.append([chr(vType), value.getValueNoType()])
+	return members
+
+def _decodeShard(view: memoryview, start: int, end: int, jsonl: bool) -> tuple[dict, list[str]]:
+	stats = {}
+	lines = []
+	unpack_from = _UINT32_BE.unpack_from
+	offset = start
+	while offset < end:
+		size = unpack_from(view, offset)[0]
+		error = None
+		try:
+			caps, _ = Caps.fromBytes(view[offset:offset + size])
+			name = packetType(caps)
+		except Caps.CapsError as e:
+			caps = None
+			name = 'INVALID'
+			error = str(e)
+		entry = stats.get(name)
+		if entry is None:
+			entry = stats[name] = PacketStats()
+		entry.add(size)
+		if jsonl:
+			line = {'offset': offset, 'size': size, 'type': name}
+			if caps is None:
+				line['error'] = error
+			else:
+				line['members'] = _jsonMembers(caps)
+			lines.append(json.dumps(line, allow_nan=False))
+		offset += size
+	return stats, lines
+
+def _analyzeShard(path: str, start: int, end: int, jsonl: bool) -> tuple[dict, list[str]]:
+	"""Decode the frames between start and end of the capture at path, runs in a worker process"""
+	with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+		# The frames are views of the map, so they must all be gone before the map is closed
+		with memoryview(data) as view:
+			try:
+				return _decodeShard(view, start, end, jsonl)
+			except BaseException as e:
+				# The traceback keeps the locals of _decodeShard alive, clear them so the real error isn't replaced by a BufferError
+				traceback.clear_frames(e.__traceback__)
+				raise
+
+def analyzeCapture(path: str, jsonl: Any = None, workers: int = None, shardSize: int = DEFAULT_SHARD_SIZE) -> CaptureResult:
+	"""Decode every frame in a capture file
+
+	:param str path: Path of the capture file
+	:param Optional[TextIO] jsonl: When given, one JSON line per frame is written to it, in file order
+	:param Optional[int] workers: Number of worker processes, defaults to the number of CPUs. A capture of one shard is decoded in this process
+	:param int shardSize: Minimum amount of bytes per shard
+	"""
+	size = os.path.getsize(path)
+	if size == 0:
+		return CaptureResult({}, 0, 0)
+	with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+		with memoryview(data) as view:
+			shards, complete, corrupt = planShards(view, shardSize)
+
+	stats = {}
+	if len(shards) <= 1 or workers == 1:
+		results = (_analyzeShard(path, start, end, jsonl is not None) for start, end in shards)
+		executor = None
+	else:
+		executor = ProcessPoolExecutor(workers)
+		results = executor.map(_analyzeShard, [path] * len(shards), [shard[0] for shard in shards], [shard[1] for shard in shards], [jsonl is not None] * len(shards))
+	try:
+		for shardStats, lines in results:
+			for name, entry in shardStats.items():
+				stats.setdefault(name, PacketStats()).merge(entry)
+			if lines:
+				jsonl.write('\n'.join(lines))
+				jsonl.write('\n')
+	finally:
+		if executor is not None:
+			executor.shutdown()
+	return CaptureResult(stats, size, (size if corrupt is None else corrupt) - complete, corrupt)
+
+def formatStats(result: CaptureResult) -> str:
+	"""Format the statistics of a capture as a table"""
+	lines = ['%-24s %10s %14s %10s %10s' % ('type', 'frames', 'bytes', 'min', 'max')]
+	for name, entry in sorted(result.stats.items(), key=lambda item: -item[1].bytes):
+		lines.append('%-24s %10d %14d %10d %10d' % (name, entry.frames, entry.bytes, entry.minSize, entry.maxSize))
+	lines.append('%-24s %10d %14d' % ('total', sum(entry.frames for entry in result.stats.values()), sum(entry.bytes for entry in result.stats.values())))
+	if result.trailing:
+		lines.append('%d trailing bytes are not a complete frame' % (result.trailing))
+	if result.corruptOffset is not None:
+		lines.append('Corrupt frame size at offset %d, the rest of the capture was skipped' % (result.corruptOffset))
+	return '\n'.join(lines)
+
+def main(argv: list[str] = None) -> int:
+	parser = argparse.ArgumentParser(prog='python -m pyrokid_cxr_clientm.capture', description='Decode recorded Caps traffic and show statistics per packet type')
+	parser.add_argument('capture', help='capture file with the raw received bytes')
+	parser.add_argument('--jsonl', action='store_true', help='write every frame as a JSON line instead of the statistics')
+	parser.add_argument('--output', help='file to write the JSON lines to, defaults to stdout')
+	parser.add_argument('--workers', type=int, default=None, help='number of worker processes, defaults to the number of CPUs')
+	parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE // (1024 * 1024), help='shard size in MiB (default: %(default)s)')
+	args = parser.parse_args(argv)
+
+	began = time.perf_counter()
+	shardSize = max(1, args.shard_size) * 1024 * 1024
+	if args.jsonl:
+		output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+		try:
+			result = analyzeCapture(args.capture, output, args.workers, shardSize)
+		finally:
+			if output is not sys.stdout:
+				output.close()
+	else:
+		result = analyzeCapture(args.capture, None, args.workers, shardSize)
+		print(formatStats(result))
+	elapsed = time.perf_counter() - began
+	print('Decoded %d bytes in %.2fs (%.1f MB/s)' % (result.size, elapsed, result.size / elapsed / 1e6 if elapsed else 0), file=sys.stderr)
+	return 1 if result.corruptOffset is not None else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,7 +1,9 @@
 from __future__ import annotations
-from .utils import ValueUtil
-from .libcaps import Caps
+from .utils import ValueUtil, LogUtil
+from .libcaps import Caps, CapsStreamDecoder
+from collections import deque
 from enum import IntEnum
+import asyncio
 
 class PacketTypeIds(IntEnum):
 	"""Packet Type IDs used in :class:`CXRSocketProtocol` Requests and Responses"""
@@ -23,21 +25,490 @@ class PacketTypeIds(IntEnum):
 	AI_START = 0x3001
 	AI_DATA = 0x3002
 	AI_END = 0x3003
+	ARTC_FRAME = 0x4001
+
+class TrafficClass(IntEnum):
+	"""Traffic classes of :class:`CXRSendScheduler`"""
+	CONTROL = 0 # commands, requests and notifies, always sent first
+	AUDIO = 1 # audio stream data
+	MEDIA = 2 # ARTC frames
+	BULK = 3 # transfers and other large packets
+
+class CXRSendScheduler:
+	"""Outbound queue with a queue per :class:`TrafficClass`, that gathers frames and writes them to the stream together
+
+	``CONTROL`` frames are always written first, so they never wait behind queued media. The other classes share the link
+	by deficit round robin, each getting ``QUANTUM * weight`` bytes per round. Frames that are queued within ``delay`` seconds
+	of each other go out in one vectored write of up to ``maxBytes``, and the next write only starts once the stream has drained,
+	so queued media stays in these queues where control frames can overtake it.
+
+	A frame is never split, the receiver frames packets on their size prefix, so a control frame waits at most for the frames already being written
+	and whatever the socket buffers. Large payloads should be sent as several packets to keep that short.
+
+	:param asyncio.StreamWriter writer: The stream the frames are written to
+	:param float delay: Seconds to wait for more frames before writing, 0 only gathers the frames sent in the same event loop iteration
+	:param int maxBytes: Amount of bytes per write, a write always contains at least one frame
+	"""
+
+	QUANTUM = 4 * 1024
+	"""Bytes per weight that a traffic class may send per round"""
+
+	WEIGHTS = {
+		TrafficClass.AUDIO: 4,
+		TrafficClass.MEDIA: 2,
+		TrafficClass.BULK: 1,
+	}
+	"""Share of the link of every traffic class next to ``CONTROL``"""
+
+	def __init__(self, writer: asyncio.StreamWriter, delay: float = 0.0, maxBytes: int = 8 * 1024):
+		self.writer = writer
+		self.delay = delay
+		self.maxBytes = maxBytes
+		self.weights = dict(CXRSendScheduler.WEIGHTS)
+		"""Weights of this scheduler, see :attr:`CXRSendScheduler.WEIGHTS`"""
+		self.frames = 0
+		"""Number of frames written"""
+		self.writes = 0
+		"""Number of writes to the stream"""
+		self.bytes = 0
+		"""Number of bytes written"""
+		self.__queues = {trafficClass: deque() for trafficClass in TrafficClass}
+		self.__deficits = {trafficClass: 0 for trafficClass in TrafficClass}
+		self.__order = [trafficClass for trafficClass in TrafficClass if trafficClass != TrafficClass.CONTROL]
+		self.__next = 0
+		self.__queued = 0
+		self.__flushNow = False
+		self.__idle = None
+		self.__wake = None
+		self.__task = None
+		self.__error = None
+
+	async def write(self, data: bytes, flush: bool = False, trafficClass: TrafficClass = TrafficClass.CONTROL) -> None:
+		"""Queue a frame and wait until it's written and the stream accepted it
+
+		:param bytes data: The frame
+		:param bool flush: Write the queue right away, for latency-critical frames
+		:param TrafficClass trafficClass: The queue of the frame
+		"""
+		if self.__error is not None:
+			raise self.__error
+		loop = asyncio.get_event_loop()
+		written = loop.create_future()
+		self.__queues[trafficClass].append((data, written))
+		self.__queued += len(data)
+		if flush:
+			self.__flushNow = True
+		if self.__task is None:
+			self.__task = loop.create_task(self.__run())
+		if self.__idle is not None and not self.__idle.done():
+			self.__idle.set_result(None)
+		if flush or self.__queued >= self.maxBytes:
+			self.__notify()
+		await written
+
+	def __notify(self) -> None:
+		"""End the delay of the sender task"""
+		if self.__wake is not None and not self.__wake.done():
+			self.__wake.set_result(None)
+
+	def flush(self) -> None:
+		"""Write all queued frames without waiting for the delay"""
+		self.__flushNow = True
+		self.__notify()
+
+	async def __run(self) -> None:
+		loop = asyncio.get_event_loop()
+		batch = []
+		try:
+			while True:
+				if not self.__queued:
+					self.__idle = loop.create_future()
+					await self.__idle
+				if self.delay > 0 and not self.__flushNow and self.__queued < self.maxBytes:
+					self.__wake = loop.create_future()
+					handle = loop.call_later(self.delay, self.__notify)
+					await self.__wake
+					handle.cancel()
+				else:
+					# Let the senders of this event loop iteration queue their frames first
+					await asyncio.sleep(0)
+				self.__flushNow = False
+				batch = self.__take()
+				if len(batch) == 1:
+					self.writer.write(batch[0][0])
+				else:
+					self.writer.writelines([data for data, _ in batch])
+				size = sum(len(data) for data, _ in batch)
+				self.frames += len(batch)
+				self.writes += 1
+				self.bytes += size
+				await self.writer.drain()
+				for _, written in batch:
+					if not written.done():
+						written.set_result(None)
+				batch = []
+		except asyncio.CancelledError:
+			self.__fail(batch, ConnectionError("Connection closed"))
+			raise
+		except Exception as e:
+			self.__fail(batch, e)
+
+	def __take(self) -> list[tuple[bytes, asyncio.Future]]:
+		"""Take up to maxBytes of frames from the queues, control frames first and the others by deficit round robin"""
+		batch = []
+		size = 0
+		control = self.__queues[TrafficClass.CONTROL]
+		while control and (not batch or size + len(control[0][0]) <= self.maxBytes):
+			frame = control.popleft()
+			batch.append(frame)
+			size += len(frame[0])
+		order = self.__order
+		deficits = self.__deficits
+		queues = [self.__queues[trafficClass] for trafficClass in order]
+		while not control and size < self.maxBytes and any(queues):
+			trafficClass = order[self.__next]
+			queue = queues[self.__next]
+			if not queue:
+				deficits[trafficClass] = 0
+				self.__next = (self.__next + 1) % len(order)
+				continue
+			if deficits[trafficClass] < len(queue[0][0]):
+				deficits[trafficClass] += CXRSendScheduler.QUANTUM * self.weights[trafficClass]
+			while queue and len(queue[0][0]) <= deficits[trafficClass] and (not batch or size + len(queue[0][0]) <= self.maxBytes):
+				frame = queue.popleft()
+				deficits[trafficClass] -= len(frame[0])
+				batch.append(frame)
+				size += len(frame[0])
+			if queue and batch and size + len(queue[0][0]) > self.maxBytes and len(queue[0][0]) <= deficits[trafficClass]:
+				break # this class may send more, but not in this write
+			self.__next = (self.__next + 1) % len(order)
+		self.__queued -= size
+		return batch
+
+	def __fail(self, batch: list, error: Exception) -> None:
+		self.__error = error
+		for queue in self.__queues.values():
+			batch.extend(queue)
+			queue.clear()
+		self.__queued = 0
+		for _, written in batch:
+			if not written.done():
+				written.set_exception(error)
+
+	def close(self) -> None:
+		"""Stop the sender task and drop all queued frames, their senders get a :type:`ConnectionError`"""
+		if self.__task is not None:
+			self.__task.cancel()
+			self.__task = None
+		self.__fail([], ConnectionError("Connection closed"))
+
+	def pending(self) -> dict:
+		"""Return the number of queued frames of every traffic class"""
+		return {trafficClass.name: len(queue) for trafficClass, queue in self.__queues.items()}
+
+	def stats(self) -> dict:
+		"""Return the write counters, including the achieved frames per write"""
+		return {
+			'frames': self.frames,
+			'writes': self.writes,
+			'bytes': self.bytes,
+			'framesPerWrite': self.frames / self.writes if self.writes else 0.0,
+		}
 
 class CXRSocketProtocol:
+	"""Caps packet connection with the glasses, running on asyncio
+
+	Packets are 4 byte length-prefixed :type:`Caps` frames, the first member of every packet is its :class:`PacketTypeIds`.
+	Any stream transport works, so next to the RFCOMM socket a local TCP or Unix socket can be used for testing.
+
+	Received packets get dispatched to the :class:`CXRSocketProtocol.Callback` based on their type id (member layouts are not confirmed yet):
+
+	- ``RESPONSE``: ``[type, id, ...]`` -> the :func:`CXRSocketProtocol.request` waiting for that id, else :func:`Callback.onResponse`
+	- ``NOTIFY``: ``[type, name, ...]`` -> :func:`Callback.onNotify`
+	- ``AI_START``: ``[type, id, name, ...]`` -> :func:`Callback.onStartAudioStream`
+	- ``AI_DATA``: ``[type, data, codecType, sequence]`` -> :func:`Callback.onAudioStream`
+	- ``ARTC_FRAME``: ``[type, data]`` -> :func:`Callback.onARTCFrame`
+	- Anything else, or a packet that doesn't match its layout -> :func:`Callback.onReceived`
+	"""
 	a: str
-	b = None # BluetoothSocket
-	c = None # InputStream
-	d = None # OutputStream
-	e = None # Runnable
+	b = None # socket
+	c: asyncio.StreamReader = None
+	d: asyncio.StreamWriter = None
+	e: asyncio.Task = None # reader task
 	f: int = 0
-	g: bool = False
+	g: bool = False # connected
 	h: bool = False
 	i: CXRSocketProtocol.Callback = None
-	j: int
+	j: int = 0 # last request id
+	k: CapsStreamDecoder = None
+	l: dict = None # requests waiting for their response, by request id
+	m: CXRSendScheduler = None # outbound queue
+
+	READ_SIZE = 64 * 1024
+	"""Maximum amount of bytes read from the stream at once"""
+
+	COALESCE_DELAY = 0.0
+	"""Seconds :func:`CXRSocketProtocol.send` waits for more packets to write together, 0 only gathers packets sent in the same event loop iteration"""
+
+	COALESCE_BYTES = 8 * 1024
+	"""Amount of queued bytes that makes :func:`CXRSocketProtocol.send` write right away"""
+
+	REQUEST_TIMEOUT = 5.0
+	"""Default amount of seconds :func:`CXRSocketProtocol.request` waits for a response"""
+
+	class ResponseTimeoutError(asyncio.TimeoutError):
+		"""Exception that throws when no response arrived in time, the equivalent of ``ValueUtil.CxrStatus.RESPONSE_TIMEOUT``"""
+		status = ValueUtil.CxrStatus.RESPONSE_TIMEOUT
+
+		def __init__(self, requestId: int):
+			super().__init__("No response to request %d" % (requestId))
+			self.requestId = requestId
+			"""Id of the request that timed out"""
 
 	def version(self) -> int: return 4
 
+	async def connectSocket(self, sock, callback: CXRSocketProtocol.Callback) -> None:
+		"""Start the connection over an already connected socket, for example the RFCOMM socket
+
+		:param socket.socket sock: The connected socket
+		:param CXRSocketProtocol.Callback callback: The callback that receives the packets
+		"""
+		self.b = sock
+		reader, writer = await asyncio.open_connection(sock=sock, limit=CXRSocketProtocol.READ_SIZE)
+		self.start(reader, writer, callback)
+
+	async def connectTcp(self, host: str, port: int, callback: CXRSocketProtocol.Callback) -> None:
+		"""Start the connection to a TCP stand-in of the glasses
+
+		:param str host: The host to connect to
+		:param int port: The port to connect to
+		:param CXRSocketProtocol.Callback callback: The callback that receives the packets
+		"""
+		reader, writer = await asyncio.open_connection(host, port, limit=CXRSocketProtocol.READ_SIZE)
+		self.start(reader, writer, callback)
+
+	async def connectUnix(self, path: str, callback: CXRSocketProtocol.Callback) -> None:
+		"""Start the connection to a Unix socket stand-in of the glasses
+
+		:param str path: Path of the Unix socket
+		:param CXRSocketProtocol.Callback callback: The callback that receives the packets
+		"""
+		reader, writer = await asyncio.open_unix_connection(path, limit=CXRSocketProtocol.READ_SIZE)
+		self.start(reader, writer, callback)
+
+	def start(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, callback: CXRSocketProtocol.Callback) -> None:
+		"""Start the reader task on an open stream pair, must be called from the event loop
+
+		:param asyncio.StreamReader reader: The stream packets are read from
+		:param asyncio.StreamWriter writer: The stream packets are written to
+		:param CXRSocketProtocol.Callback callback: The callback that receives the packets
+		"""
+		self.c = reader
+		self.d = writer
+		self.i = callback
+		self.l = {}
+		self.m = CXRSendScheduler(writer, CXRSocketProtocol.COALESCE_DELAY, CXRSocketProtocol.COALESCE_BYTES)
+		# Keep the transport buffer small, so queued media waits in the scheduler where control packets can overtake it
+		writer.transport.set_write_buffer_limits(high=CXRSocketProtocol.COALESCE_BYTES)
+		self.g = True
+		self.e = asyncio.get_event_loop().create_task(self.__readLoop())
+
+	def isConnected(self) -> bool:
+		"""Return if the connection is open"""
+		return self.g
+
+	async def send(self, caps: Caps, flush: bool = False, trafficClass: TrafficClass = None) -> None:
+		"""Send a packet, waits until the transport accepted it
+
+		Small packets are gathered and written together, see :attr:`CXRSocketProtocol.COALESCE_DELAY`,
+		and control packets overtake queued media, see :class:`CXRSendScheduler`.
+
+		:param Caps caps: The packet, its first member should be a :class:`PacketTypeIds`
+		:param bool flush: Write it right away together with anything queued before it, for latency-critical commands
+		:param Optional[TrafficClass] trafficClass: The queue of the packet, by default it follows from the packet type,
+			and unknown packets larger than :attr:`CXRSocketProtocol.COALESCE_BYTES` are ``BULK``
+		"""
+		if not self.g:
+			raise ConnectionError("Not connected")
+		data = caps.serialize()
+		if trafficClass is None:
+			trafficClass = CXRSocketProtocol.__trafficClass(caps, len(data))
+		await self.m.write(data, flush, trafficClass)
+
+	@staticmethod
+	def __trafficClass(caps: Caps, size: int) -> TrafficClass:
+		trafficClass = None
+		if len(caps) and caps.at(0).type() == Caps.Value.TYPE_UINT32:
+			trafficClass = CXRSocketProtocol._TRAFFIC_CLASSES.get(caps.at(0).getInt())
+		if trafficClass is None:
+			trafficClass = TrafficClass.BULK if size > CXRSocketProtocol.COALESCE_BYTES else TrafficClass.CONTROL
+		return trafficClass
+
+	def getWriteStats(self) -> dict:
+		"""Return the counters of the outbound queue, see :func:`CXRSendScheduler.stats`"""
+		return self.m.stats() if self.m is not None else CXRSendScheduler(None).stats()
+
+	async def request(self, caps: Caps, timeout: float = None) -> Caps:
+		"""Send a request and wait for its response
+
+		The request is sent as ``[REQUEST, id, *members of caps]``, and the response with the same id is returned.
+		Any number of requests can be in flight, so run them concurrently to pipeline them, see :func:`CXRSocketProtocol.requestAll`.
+
+		:param Caps caps: The members of the request
+		:param Optional[float] timeout: Seconds to wait for the response, defaults to :attr:`CXRSocketProtocol.REQUEST_TIMEOUT`
+		:raises CXRSocketProtocol.ResponseTimeoutError: When no response arrived in time
+		:raises ConnectionError: When the connection is lost before the response arrived
+		:returns: The whole response packet
+		"""
+		if not self.g:
+			raise ConnectionError("Not connected")
+		requestId = self.__nextRequestId()
+		frame = Caps().writeUInt32(PacketTypeIds.REQUEST).writeUInt32(requestId)
+		for index in range(len(caps)):
+			frame.write(caps.at(index))
+		future = asyncio.get_event_loop().create_future()
+		self.l[requestId] = future
+		try:
+			await self.send(frame)
+			return await asyncio.wait_for(future, CXRSocketProtocol.REQUEST_TIMEOUT if timeout is None else timeout)
+		except asyncio.TimeoutError:
+			raise CXRSocketProtocol.ResponseTimeoutError(requestId) from None
+		finally:
+			self.l.pop(requestId, None)
+
+	async def requestAll(self, requests: list[Caps], timeout: float = None) -> list[Caps]:
+		"""Send several requests at once and wait for all responses, so they cost one round trip
+
+		:param list[Caps] requests: The members of every request
+		:param Optional[float] timeout: Seconds to wait for each response, defaults to :attr:`CXRSocketProtocol.REQUEST_TIMEOUT`
+		:returns: The responses, in the order of the requests
+		"""
+		return list(await asyncio.gather(*(self.request(caps, timeout) for caps in requests)))
+
+	def __nextRequestId(self) -> int:
+		# Request ids are UINT32, skip 0 and ids that are still waiting after a wrap around
+		while True:
+			self.j = self.j % 0xFFFFFFFF + 1
+			if self.j not in self.l:
+				return self.j
+
+	def __onResponse(self, requestId: int, caps: Caps) -> None:
+		future = self.l.pop(requestId, None) if self.l else None
+		if future is None:
+			self.i.onResponse(requestId, caps)
+		elif not future.done():
+			future.set_result(caps)
+
+	async def close(self) -> None:
+		"""Stop the reader task and close the connection"""
+		if self.e is not None and self.e is not asyncio.current_task():
+			self.e.cancel()
+			try:
+				await self.e
+			except asyncio.CancelledError:
+				pass
+			except Exception:
+				# The reader's own error, it was logged there
+				pass
+		if self.d is not None:
+			self.d.close()
+			try:
+				await self.d.wait_closed()
+			except (ConnectionError, OSError):
+				pass
+
+	async def readPackets(self) -> AsyncIterator[Caps]:
+		"""Read from the stream and yield every received packet, until the stream ends
+
+		Partial reads are collected by a :class:`CapsStreamDecoder`, so packets are yielded as soon as they are complete.
+		"""
+		self.k = CapsStreamDecoder()
+		while True:
+			chunk = await self.c.read(CXRSocketProtocol.READ_SIZE)
+			if not chunk:
+				break
+			try:
+				frames = self.k.feed(chunk)
+			except Caps.CapsError as e:
+				# Deliver the packets in front of the corrupt one before giving up on the stream
+				for caps in e.frames:
+					yield caps
+				raise
+			for caps in frames:
+				yield caps
+
+	async def __readLoop(self) -> None:
+		try:
+			async for caps in self.readPackets():
+				self.dispatch(caps)
+		except asyncio.CancelledError:
+			raise
+		except Exception as e:
+			# After a corrupt frame the stream can't be framed anymore, so drop the connection
+			LogUtil.e("CXRSocketProtocol", e)
+		finally:
+			self.g = False
+			if self.m is not None:
+				self.m.close()
+			if self.d is not None:
+				self.d.close()
+			pending, self.l = self.l, {}
+			for future in pending.values():
+				if not future.done():
+					future.set_exception(ConnectionError("Connection closed"))
+			if self.i is not None:
+				try:
+					self.i.onDisconnect()
+				except Exception as e:
+					LogUtil.e("CXRSocketProtocol", e)
+
+	def dispatch(self, caps: Caps) -> None:
+		"""Call the :class:`CXRSocketProtocol.Callback` method for a received packet"""
+		packetType = None
+		if len(caps) and caps.at(0).type() == Caps.Value.TYPE_UINT32:
+			packetType = caps.at(0).getInt()
+		handler = CXRSocketProtocol._HANDLERS.get(packetType)
+		args = None
+		if handler is not None:
+			# Only the layout is checked here, errors of the callback itself must not make the packet go to onReceived too
+			try:
+				args = handler[1](caps)
+			except (IndexError, Caps.IncorrectTypeException):
+				LogUtil.w("CXRSocketProtocol", "Unexpected layout for %s packet: %s", CXRSocketProtocol.__typeName(packetType), caps)
+		try:
+			if args is not None:
+				handler[0](self, *args)
+			else:
+				self.i.onReceived(CXRSocketProtocol.__typeName(packetType), caps, None)
+		except Exception as e:
+			# A broken callback must not stop the reader
+			LogUtil.e("CXRSocketProtocol", e)
+
+	@staticmethod
+	def __typeName(packetType: int) -> str:
+		try:
+			return PacketTypeIds(packetType).name
+		except ValueError:
+			return None if packetType is None else '0x%04x' % (packetType)
+
+	# Packet type id -> traffic class of the packets we send, other packets go by their size
+	_TRAFFIC_CLASSES = {
+		PacketTypeIds.AI_DATA: TrafficClass.AUDIO,
+		PacketTypeIds.ARTC_FRAME: TrafficClass.MEDIA,
+		PacketTypeIds.TRANSFER_INFO: TrafficClass.BULK,
+		PacketTypeIds.TRANSFER_INFO_TWO: TrafficClass.BULK,
+		PacketTypeIds.TRANSFER_INFO_THREE: TrafficClass.BULK,
+	}
+
+	# Packet type id -> (function(protocol, *arguments) that handles it, function(caps) that reads the arguments)
+	_HANDLERS = {
+		PacketTypeIds.RESPONSE: (__onResponse, lambda caps: (caps.at(1).getInt(), caps)),
+		PacketTypeIds.NOTIFY: (lambda self, *args: self.i.onNotify(*args), lambda caps: (caps.at(1).getString(), caps)),
+		PacketTypeIds.AI_START: (lambda self, *args: self.i.onStartAudioStream(*args), lambda caps: (caps.at(1).getInt(), caps.at(2).getString(), caps)),
+		PacketTypeIds.AI_DATA: (lambda self, *args: self.i.onAudioStream(*args), lambda caps: (caps.at(1).getBinary(), caps.at(2).getInt(), caps.at(3).getInt())),
+		PacketTypeIds.ARTC_FRAME: (lambda self, *args: self.i.onARTCFrame(*args), lambda caps: (caps.at(1).getBinary(),)),
+	}
+
 	class Callback:
 		"""Callback Interface - Please extend the class and write your own methods!"""
 		def onResponse(self, param1Int: int, param1Caps: Caps) -> None: pass
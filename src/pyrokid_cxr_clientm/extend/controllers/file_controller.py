@@ -1,13 +1,16 @@
 from __future__ import annotations
-from typing import Callable
+from typing import Any, Callable
 from requests import Response
-from threading import Thread
-import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import formatdate
+from threading import Lock, Thread
+import glob, os, re
 from ..callbacks import ApkStatusCallback
 from ...utils import LogUtil, ValueUtil
 from ..sync.file_data import FileData
 from ..sync.file_list_response import FileListResponse
 from ..sync.retrofit_client import RetrofitClient
+from ..sync.sync_index import SyncIndex
 
 class FileController:
 	t = ["/storage/emulated/0/Recordings", "/storage/emulated/0/DCIM/Camera", "/storage/emulated/0/Movies/Camera"]
@@ -30,6 +33,13 @@ class FileController:
 	q: ApkStatusCallback = None
 	r = None
 	s: bool = False
+	u: int = 1 # max concurrent downloads
+	v: ThreadPoolExecutor = None # download workers
+	w: SyncIndex = None # index of the files that are already downloaded
+	x: list = None # file list calls of all media paths, started at once
+
+	PART_SUFFIX = '.part'
+	"""Suffix of the file a download is written to until it's complete, see :func:`FileController.partPath`"""
 
 	@staticmethod
 	def getInstance() -> FileController:
@@ -61,6 +71,8 @@ class FileController:
 	def downloadFile(paramFileController: FileController, fileList: list[FileData], fileIndex: int):
 		LogUtil.i("FileController", "downloadFile fileIndex: %d, mNeedDownload: %d", fileIndex, paramFileController.h);
 		if paramFileController.h:
+			while fileIndex < len(fileList) and FileController.isSynced(paramFileController, fileList[fileIndex]):
+				fileIndex += 1
 			if fileIndex >= len(fileList):
 				paramFileController.downloadMedia()
 			else:
@@ -69,11 +81,177 @@ class FileController:
 				absoluteFilePath = fileData.absoluteFilePath
 				requestBody = RetrofitClient.createPartFromString(absoluteFilePath)
 				LogUtil.i("FileController", "downloadFile requestBody: %s", requestBody)
-				paramFileController.k = RetrofitClient.getInstance().getService().downloadFile(requestBody)
+				rangeHeader = FileController.resumeRange(savePath, fileData)
+				paramFileController.k = RetrofitClient.getInstance().getService().downloadFile(requestBody, rangeHeader, None if rangeHeader is None else FileController.ifRange(fileData))
 				LogUtil.i("FileController", "mDownloadFileCall: %s", paramFileController.k)
 				paramFileController.l = True
 				paramFileController.k.enqueue(_mDownloadFileCall(paramFileController, absoluteFilePath, savePath, fileData, fileList, fileIndex))
 
+	@staticmethod
+	def downloadFiles(paramFileController: FileController, fileList: list[FileData], fileIndex: int):
+		"""Download the files of a list from fileIndex on with up to ``u`` at once, then continue with the next media path"""
+		files = [fileData for fileData in fileList[fileIndex:] if not FileController.isSynced(paramFileController, fileData)]
+		LogUtil.i("FileController", "downloadFiles fileIndex: %d, count: %d, concurrent: %d", fileIndex, len(files), paramFileController.u)
+		if not files:
+			paramFileController.downloadMedia()
+			return
+		state = {'remaining': len(files), 'failed': False}
+		lock = Lock()
+		def download(fileData: FileData):
+			try:
+				if paramFileController.h and not state['failed']:
+					savePath = paramFileController.b + fileData.fileName
+					requestBody = RetrofitClient.createPartFromString(fileData.absoluteFilePath)
+					rangeHeader = FileController.resumeRange(savePath, fileData)
+					response = RetrofitClient.getInstance().getService().downloadFile(requestBody, rangeHeader, None if rangeHeader is None else FileController.ifRange(fileData)).execute()
+					with response:
+						LogUtil.i("FileController", "downloadFiles %s result: %s, code: %d", fileData.absoluteFilePath, response.ok, response.status_code)
+						if not response.ok:
+							raise IOError("Download of %s failed with %d" % (fileData.absoluteFilePath, response.status_code))
+						if not FileController.saveFile(paramFileController, response, savePath, fileData) and paramFileController.h:
+							raise IOError("Download of %s is incomplete" % (fileData.absoluteFilePath))
+			except Exception as e:
+				LogUtil.e("FileController", "downloadFiles failed: %s", e)
+				with lock:
+					# Only the first failure is reported, the downloads that are still running finish on their own
+					report = not state['failed']
+					state['failed'] = True
+				callback = paramFileController.f
+				if report and callback is not None:
+					callback.onDownloadFailed()
+			with lock:
+				state['remaining'] -= 1
+				last = state['remaining'] == 0
+			if last and not state['failed'] and paramFileController.h:
+				paramFileController.downloadMedia()
+		for fileData in files:
+			paramFileController.v.submit(download, fileData)
+
+	@staticmethod
+	def isSynced(paramFileController: FileController, fileData: FileData) -> bool:
+		"""Return if the sync index has fileData as downloaded and unchanged, so it can be skipped"""
+		if paramFileController.w is None or not paramFileController.w.isSynced(fileData, paramFileController.b + fileData.fileName):
+			return False
+		LogUtil.i("FileController", "skip synced %s", fileData.absoluteFilePath)
+		return True
+
+	@staticmethod
+	def partPath(savePath: str, fileData: FileData) -> str:
+		"""Return the file a download of fileData is written to until it's complete
+
+		The name has the ``modifiedDate`` and ``fileSize`` of fileData in it, so a part of another version of the file is never resumed.
+		"""
+		return "%s.%d-%d%s" % (savePath, fileData.modifiedDate, fileData.fileSize, FileController.PART_SUFFIX)
+
+	@staticmethod
+	def ifRange(fileData: FileData) -> str:
+		"""Return the If-Range header that only lets the glasses continue a part when the file wasn't modified since"""
+		return formatdate(fileData.modifiedDate // 1000, usegmt=True)
+
+	@staticmethod
+	def resumeRange(savePath: str, fileData: FileData) -> str:
+		"""Return the Range header to resume the partial download of a file, or None to download it from the start
+
+		Parts of other versions of the file are deleted.
+		"""
+		partPath = FileController.partPath(savePath, fileData)
+		for stalePath in glob.glob(glob.escape(savePath) + '*' + FileController.PART_SUFFIX):
+			# Parts of other files can start with savePath too, like "a.jpg.bak.1-2.part" of "a.jpg.bak"
+			version = stalePath[len(savePath):-len(FileController.PART_SUFFIX)]
+			if stalePath != partPath and (not version or re.fullmatch(r'\.\d+-\d+', version)):
+				LogUtil.i("FileController", "delete stale part %s", stalePath)
+				os.unlink(stalePath)
+		try:
+			size = os.path.getsize(partPath)
+		except OSError:
+			return None
+		if 0 < size < fileData.fileSize:
+			LogUtil.i("FileController", "resume %s at %d of %d", partPath, size, fileData.fileSize)
+			return "bytes=%d-" % (size)
+		# Nothing to resume
+		os.unlink(partPath)
+		return None
+
+	@staticmethod
+	def resumeOffset(responseBody: Response, partPath: str, fileData: FileData) -> int:
+		"""Return the offset a 206 response continues the part at, or None when it doesn't continue it"""
+		# "bytes start-end/total"
+		unit, _, contentRange = responseBody.headers.get('content-range', '').partition(' ')
+		span, _, total = contentRange.partition('/')
+		start = span.partition('-')[0]
+		if unit != 'bytes' or not start.isdigit() or total != str(fileData.fileSize):
+			return None
+		try:
+			if int(start) != os.path.getsize(partPath):
+				return None
+		except OSError:
+			return None
+		return int(start)
+
+	@staticmethod
+	def saveFile(paramFileController: FileController, responseBody: Response, savePath: str, fileData: FileData) -> bool:
+		"""Write a downloaded file to savePath and report it to the callback
+
+		The data goes into the file of :func:`FileController.partPath` first, which is appended to when the response continues it
+		(206 from the offset it ends at, of a file with the size of fileData), and renamed to savePath once it has the size of fileData.
+		So a broken download can be resumed, and savePath is never truncated.
+
+		:returns: If the file is complete
+		"""
+		createDate: int = fileData.createDate
+		partPath = FileController.partPath(savePath, fileData)
+		try:
+			if os.path.exists(savePath):
+				LogUtil.w("FileController", "file existed %s", savePath)
+				#os.unlink(savePath)
+				#LogUtil.i("FileController", "file delete result: %s", delete)
+			else:
+				LogUtil.w("FileController", "file not existed %s", savePath)
+			offset = 0
+			if responseBody.status_code == 206:
+				offset = FileController.resumeOffset(responseBody, partPath, fileData)
+				if offset is None:
+					# The part doesn't match what was sent, start over on the next try
+					LogUtil.e("FileController", "unexpected range %s for %s", responseBody.headers.get('content-range'), partPath)
+					if os.path.exists(partPath):
+						os.unlink(partPath)
+					return False
+			if offset:
+				LogUtil.i("FileController", "resuming %s at %d", partPath, offset)
+			written = offset
+			with open(partPath, 'ab' if offset else 'wb') as f:
+				for chunk in responseBody.iter_content(chunk_size=8192):
+					if not paramFileController.h:
+						break
+					f.write(chunk)
+					written += len(chunk)
+			if not paramFileController.h:
+				LogUtil.e("FileController", "saveFile stopped")
+				return False
+			if written != fileData.fileSize:
+				LogUtil.e("FileController", "saveFile incomplete, got %d of %d bytes, keeping %s to resume", written, fileData.fileSize, partPath)
+				return False
+			os.replace(partPath, savePath)
+			os.utime(savePath, (createDate / 1000, createDate / 1000))
+			if paramFileController.w is not None:
+				paramFileController.w.markSynced(fileData, savePath)
+			LogUtil.i("FileController", "saveFile succeed,savePath: %s", savePath)
+			'''
+			Intent intent = new Intent("android.intent.action.MEDIA_SCANNER_SCAN_FILE")
+			intent.setData(Uri.fromFile(file))
+			fileController.a.sendBroadcast(intent)
+			'''
+			LogUtil.i("FileController", "sendBroadcast to scanning media file")
+			callback: FileController.Callback = paramFileController.f
+			if callback is not None:
+				callback.onSingleFileDownloaded(savePath)
+			else:
+				LogUtil.d("FileController", "mCallback is null")
+			return True
+		except Exception as e:
+			LogUtil.e("FileController", e)
+			return False
+
 	def downloadMedia(self):
 		self.g += 1
 		LogUtil.i("FileController", "downloadMedia mMediaIndex: %d, mNeedDownload: %d", self.g, self.h)
@@ -81,6 +259,12 @@ class FileController:
 			return
 		if self.g < len(self.c):
 			LogUtil.i("FileController", "fetchFileList")
+			if self.x is not None:
+				# Listed while the previous media path was downloading, continue as soon as it's there
+				self.i, listing = self.x[self.g]
+				self.j = True
+				listing.add_done_callback(_mFetchFileListCall(self).onListed)
+				return
 			requestBody = RetrofitClient.createPartFromString(self.c[self.g])
 			LogUtil.i("FileController", "fetchFileList requestBody: %s", requestBody)
 			self.i = RetrofitClient.getInstance().getService().getFileList(requestBody)
@@ -94,6 +278,18 @@ class FileController:
 			else:
 				LogUtil.e("FileController", "mCallback is null")
 
+	@staticmethod
+	def fetchFileLists(paths: list[str]) -> list[tuple[Any, Future]]:
+		"""Start listing all paths at once, returns the call and a future with its response for each path"""
+		LogUtil.i("FileController", "fetchFileLists: %s", paths)
+		listings = []
+		for path in paths:
+			call = RetrofitClient.getInstance().getService().getFileList(RetrofitClient.createPartFromString(path))
+			listing = Future()
+			call.enqueue(_mPrefetchFileListCall(listing))
+			listings.append((call, listing))
+		return listings
+
 	def reportDownload(self, paramString: str):
 		LogUtil.i("FileController", "reportDownload")
 		requestBody = RetrofitClient.createPartFromString(paramString)
@@ -132,7 +328,14 @@ class FileController:
 					arrayList.append(FileController.t[0])
 		return arrayList
 
-	def startDownload(self, paramContext, savePath: str, types: list[ValueUtil.CxrMediaType], fileToDownload: str, ipAddress: str, paramCallback: FileController.Callback) -> None:
+	def startDownload(self, paramContext, savePath: str, types: list[ValueUtil.CxrMediaType], fileToDownload: str, ipAddress: str, paramCallback: FileController.Callback, maxConcurrentDownloads: int = 1, syncIndex: SyncIndex = None) -> None:
+		"""Download the media files of the given types from the glasses
+
+		:param int maxConcurrentDownloads: Number of files to download at once. With more than 1 the files of a media path are downloaded in parallel,
+			:func:`Callback.onSingleFileDownloaded` can then be called from several threads at once and not in list order.
+			:func:`Callback.onDownloadFinished` is still called once, after every file is done
+		:param Optional[SyncIndex] syncIndex: Skip the files this index has as downloaded and unchanged, and add every file that completes to it
+		"""
 		LogUtil.i("FileController", "startDownload")
 		if savePath is not None and not len(savePath.strip()) == 0 and not savePath.endswith('/'):
 			savePath += '/' # Added by me
@@ -144,7 +347,13 @@ class FileController:
 		self.f = paramCallback
 		self.g = -1
 		self.h = True
+		self.w = syncIndex
+		self.u = max(1, maxConcurrentDownloads)
+		if self.v is not None:
+			self.v.shutdown(wait=False)
+		self.v = ThreadPoolExecutor(self.u, thread_name_prefix='FileController') if self.u > 1 else None
 		RetrofitClient.getInstance().setBaseUrl("http://" + ipAddress + ":8848")
+		self.x = FileController.fetchFileLists(self.c)
 		self.downloadMedia()
 	
 	def stopDownload(self) -> None:
@@ -162,6 +371,11 @@ class FileController:
 		if self.o is not None and self.p:
 			LogUtil.i("FileController", "cancel mDeleteFileCall")
 			self.o.cancel()
+		if self.v is not None:
+			LogUtil.i("FileController", "stop download workers")
+			self.v.shutdown(wait=False)
+			self.v = None
+		self.x = None
 		self.a = None
 		self.b = None
 		self.c = None
@@ -263,7 +477,6 @@ class _mDownloadFileCall:
 			str1: str = self.b.e
 			str2: str = self.b.d
 			fileData: FileData = self.b.c
-			createDate: int = fileData.createDate
 			LogUtil.i("FileController", "cxr-- saveFile mNeedDownload: %s, len: %s", fileController.h, self.a.headers.get('content-length'))
 			if not fileController.h:
 				LogUtil.i("FileController", str1)
@@ -274,36 +487,7 @@ class _mDownloadFileCall:
 					LogUtil.i("FileController", "mFilePath is nonnull");
 					FileController.downloadMedia()
 					return
-			try:
-				if os.path.exists(str2):
-					LogUtil.w("FileController", "file existed %s", str2)
-					#os.unlink(str2)
-					#LogUtil.i("FileController", "file delete result: %s", delete)
-				else:
-					LogUtil.w("FileController", "file not existed %s", str2)
-				with open(str2, 'wb') as f:
-					for chunk in self.a.iter_content(chunk_size=8192):
-						if not fileController.h:
-							break
-						f.write(chunk)
-				if fileController.h:
-					os.utime(str2, (createDate / 1000, createDate / 1000))
-					LogUtil.i("FileController", "saveFile succeed,savePath: %s", str2)
-					'''
-					Intent intent = new Intent("android.intent.action.MEDIA_SCANNER_SCAN_FILE")
-					intent.setData(Uri.fromFile(file))
-					fileController.a.sendBroadcast(intent)
-					'''
-					LogUtil.i("FileController", "sendBroadcast to scanning media file")
-					callback: FileController.Callback = fileController.f
-					if callback is not None:
-						callback.onSingleFileDownloaded(str2)
-					else:
-						LogUtil.d("FileController", "mCallback is null")
-				else:
-					LogUtil.e("FileController", "saveFile stopped")
-			except Exception as e:
-				LogUtil.e("FileController", e)
+			FileController.saveFile(fileController, self.a, str2, fileData)
 			LogUtil.i("FileController", str1)
 			listV = self.b.b
 			if fileController.d is not None or True: # I added or True, cause with startSync it passes None but it doesnt seem like .d gets a value along the way...
@@ -338,7 +522,10 @@ class _mFetchFileListCall:
 				LogUtil.i("FileController", "fileIndex: %d", b1)
 				if self.a.g == 0 and callback is not None:
 					callback.onDownloadStart()
-				FileController.downloadFile(self.a, listV, b1)
+				if self.a.v is not None:
+					FileController.downloadFiles(self.a, listV, b1)
+				else:
+					FileController.downloadFile(self.a, listV, b1)
 			else:
 				self.a.downloadMedia()
 		else:
@@ -347,6 +534,12 @@ class _mFetchFileListCall:
 				callback.onDownloadFailed()
 			else:
 				LogUtil.e("FileController", "mCallback is null")
+	def onListed(self, listing: Future):
+		paramCall = self.a.i
+		try:
+			self.onResponse(paramCall, listing.result())
+		except Exception as exception:
+			self.onFailure(paramCall, exception)
 	def onFailure(self, paramCall, paramThrowable: Exception):
 		LogUtil.e("FileController", "mFetchFileListCall onFailure message: %s", paramThrowable)
 		self.a.j = False
@@ -356,6 +549,13 @@ class _mFetchFileListCall:
 		else:
 			LogUtil.e("FileController", "mCallback is null")
 
+class _mPrefetchFileListCall: # retrofit2.Callback<FileListResponse>
+	def __init__(self, listing: Future): self.a = listing
+	def onResponse(self, paramCall, param1Response: Response):
+		self.a.set_result(param1Response)
+	def onFailure(self, paramCall, paramThrowable: Exception):
+		self.a.set_exception(paramThrowable)
+
 class _mReportDownloadCall: # retrofit2.Callback<ResponseBody>
 	def __init__(self, this: FileController, param1String: str):
 		self.a = param1String
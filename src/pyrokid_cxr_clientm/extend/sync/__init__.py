@@ -1,5 +1,6 @@
-__all__ = ['BaseNetworkResponse', 'FileData', 'FileListResponse']
+__all__ = ['BaseNetworkResponse', 'FileData', 'FileListResponse', 'SyncIndex']
 
 from .base_network_response import BaseNetworkResponse
 from .file_data import FileData
 from .file_list_response import FileListResponse
+from .sync_index import SyncIndex
@@ -1,12 +1,28 @@
 from __future__ import annotations
+from collections import OrderedDict
+from threading import Lock
 from ...utils import LogUtil
 from .header_interceptor import HeaderInterceptor
 from .retrofit_service import RetrofitService
 
 class RetrofitClient:
 	a: RetrofitService = None
+	b: OrderedDict = None # services by base url, least recently used first
+	c: Lock = None
+
+	POOL_SIZE = 10
+	"""Number of connections per :class:`RetrofitService` kept open to the glasses, at least the ``maxConcurrentDownloads`` of :class:`FileController`"""
+
+	KEEP_ALIVE = True
+	"""Reuse connections between requests"""
+
+	MAX_SERVICES = 4
+	"""Number of base urls a :class:`RetrofitService` is kept for, the least recently used one gets closed"""
+
 	def __init__(self):
 		LogUtil.i("RetrofitClient", "RetrofitClient constructed");
+		self.b = OrderedDict()
+		self.c = Lock()
 
 	@staticmethod
 	def getInstance() -> RetrofitClient:
@@ -24,9 +40,26 @@ class RetrofitClient:
 		return paramFile
 
 	def setBaseUrl(self, baseUrl: str):
+		"""Use the glasses at baseUrl, the service and its open connections are reused when it was used before"""
 		LogUtil.i("RetrofitClient", "setBaseUrl baseUrl: %s", baseUrl)
-		LogUtil.i("RetrofitClient", "createOkHttpClient")
-		self.a = RetrofitService(baseUrl, HeaderInterceptor("1.0", "1.0"))
+		with self.c:
+			service = self.b.pop(baseUrl, None)
+			if service is None:
+				LogUtil.i("RetrofitClient", "createOkHttpClient")
+				service = RetrofitService(baseUrl, HeaderInterceptor("1.0", "1.0"), RetrofitClient.POOL_SIZE, RetrofitClient.KEEP_ALIVE)
+			self.b[baseUrl] = service
+			while len(self.b) > max(1, RetrofitClient.MAX_SERVICES):
+				_, evicted = self.b.popitem(last=False)
+				evicted.close()
+			self.a = service
+
+	def close(self):
+		"""Close the connections of all services"""
+		with self.c:
+			for service in self.b.values():
+				service.close()
+			self.b.clear()
+			self.a = None
 
 	def getService(self) -> RetrofitService:
 		LogUtil.v("RetrofitClient", "getService")
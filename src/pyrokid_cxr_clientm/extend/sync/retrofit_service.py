@@ -1,15 +1,26 @@
 from __future__ import annotations
 from requests import Session, Response
+from requests.adapters import HTTPAdapter
 from threading import Thread
 from .base_network_response import BaseNetworkResponse
 from .file_list_response import FileListResponse
 from .header_interceptor import HeaderInterceptor
 
 class RetrofitService:
-	def __init__(self, baseUrl: str, headers):
+	def __init__(self, baseUrl: str, headers, poolSize: int = 10, keepAlive: bool = True):
 		self.baseUrl = baseUrl
 		self.s = Session()
 		self.s.headers = { **self.s.headers, **headers }
+		# Connections to the glasses are kept open and reused, up to poolSize at once
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+		self.s.mount("http://", adapter)
+		self.s.mount("https://", adapter)
+		if not keepAlive:
+			self.s.headers["Connection"] = "close"
+
+	def close(self) -> None:
+		"""Close the pooled connections"""
+		self.s.close()
 
 	def getFileList(self, filePath: str) -> FileListResponse:
 		'''
@@ -53,12 +64,14 @@ class RetrofitService:
 				return
 		return Call()
 
-	def downloadFile(self, filePath: str) -> Response:
+	def downloadFile(self, filePath: str, rangeHeader: str = None, ifRange: str = None) -> Response:
 		'''
 		@Multipart
 		@Streaming
 		@POST("/server/downloadFile")
 		Call<ResponseBody> downloadFile(@Part("filePath") RequestBody paramRequestBody);
+
+		rangeHeader and ifRange are not in the original, they're sent as the Range and If-Range headers to resume a download
 		'''
 		this = self
 		class Call:
@@ -68,10 +81,16 @@ class RetrofitService:
 				self.t.start()
 			def _run(self, callback):
 				try:
-					r = this.s.post(this.baseUrl + "/server/downloadFile", data={'filePath': filePath}, stream=True)
-					callback.onResponse(self, r)
+					callback.onResponse(self, self.execute())
 				except Exception as exception:
 					callback.onFailure(self, exception)
+			def execute(self) -> Response:
+				headers = {}
+				if rangeHeader is not None:
+					headers['Range'] = rangeHeader
+				if ifRange is not None:
+					headers['If-Range'] = ifRange
+				return this.s.post(this.baseUrl + "/server/downloadFile", data={'filePath': filePath}, headers=headers or None, stream=True)
 			def cancel(self):
 				if self.t is not None:
 					self.t.stop()
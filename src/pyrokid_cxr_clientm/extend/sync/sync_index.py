@@ -0,0 +1,65 @@
+from __future__ import annotations
+from threading import Lock
+import os, sqlite3, time
+from .file_data import FileData
+
+class SyncIndex:
+	"""SQLite index of the media files that were downloaded, so :class:`FileController` can skip them on the next sync
+
+	A file counts as synced when the index has it with the same ``fileSize`` and ``modifiedDate`` as the glasses list now,
+	and the downloaded copy is still there with that size. Every completed file is committed on its own, so an interrupted sync keeps what it finished.
+	Safe to use from the download threads.
+
+	:param str path: Path of the database file, it's created when it doesn't exist
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		"""Path of the database file"""
+		self.__lock = Lock()
+		self.__db = sqlite3.connect(path, check_same_thread=False)
+		with self.__db:
+			self.__db.execute(
+				"CREATE TABLE IF NOT EXISTS files ("
+				"absoluteFilePath TEXT PRIMARY KEY, "
+				"fileSize INTEGER NOT NULL, "
+				"modifiedDate INTEGER NOT NULL, "
+				"savePath TEXT NOT NULL, "
+				"syncedAt INTEGER NOT NULL)"
+			)
+
+	def isSynced(self, fileData: FileData, savePath: str) -> bool:
+		"""Return if fileData was downloaded to savePath before and didn't change since"""
+		with self.__lock:
+			row = self.__db.execute(
+				"SELECT savePath FROM files WHERE absoluteFilePath = ? AND fileSize = ? AND modifiedDate = ?",
+				(fileData.absoluteFilePath, fileData.fileSize, fileData.modifiedDate),
+			).fetchone()
+		if row is None or row[0] != savePath:
+			return False
+		try:
+			return os.path.getsize(savePath) == fileData.fileSize
+		except OSError:
+			return False
+
+	def markSynced(self, fileData: FileData, savePath: str) -> None:
+		"""Record that fileData was downloaded to savePath"""
+		with self.__lock, self.__db:
+			self.__db.execute(
+				"INSERT OR REPLACE INTO files (absoluteFilePath, fileSize, modifiedDate, savePath, syncedAt) VALUES (?, ?, ?, ?, ?)",
+				(fileData.absoluteFilePath, fileData.fileSize, fileData.modifiedDate, savePath, int(time.time() * 1000)),
+			)
+
+	def forget(self, absoluteFilePath: str) -> None:
+		"""Remove a file from the index, so it gets downloaded again"""
+		with self.__lock, self.__db:
+			self.__db.execute("DELETE FROM files WHERE absoluteFilePath = ?", (absoluteFilePath,))
+
+	def __len__(self) -> int:
+		with self.__lock:
+			return self.__db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+	def close(self) -> None:
+		"""Close the database"""
+		with self.__lock:
+			self.__db.close()
@@ -4,8 +4,34 @@ com.rokid.cxr.client-m:1.0.4 - jni/arm64-v8a/libcaps.so library in Python
 Caps class is THE way to decode and encode packets when communicating to the Rokid Glasses.
 """
 from __future__ import annotations
-from struct import pack as struct_pack, unpack as struct_unpack
-from io import BytesIO
+from dataclasses import dataclass
+from struct import Struct
+import re
+try:
+	import numpy
+except ImportError: # numpy is optional, the bulk LEB128 helpers fall back to pure python
+	numpy = None
+
+_UINT32_BE = Struct('>I')
+_FLOAT_LE = Struct('<f')
+_DOUBLE_LE = Struct('<d')
+
+@dataclass(frozen=True)
+class CapsLimits:
+	"""Resource limits for decoding frames that come from an untrusted peer
+
+	Every limit is checked before anything gets allocated for it, so an oversized header fails fast
+	with :type:`Caps.LimitExceededError` instead of being buffered or decoded first.
+	"""
+
+	maxFrameSize: int = 64 * 1024 * 1024
+	"""Maximum size of a whole frame in bytes, including its header"""
+	maxMembers: int = 64 * 1024 * 1024
+	"""Maximum number of members of one (nested) :type:`Caps`. Every member takes at least one descriptor byte, so by default this follows ``maxFrameSize``"""
+	maxDepth: int = 32
+	"""Maximum nesting depth of ``TYPE_OBJECT`` members, the top-level :type:`Caps` is depth 0"""
+	maxBinaryLength: int = 64 * 1024 * 1024
+	"""Maximum length of a single ``TYPE_BINARY`` member in bytes"""
 
 class Caps:
 	"""Main Caps container class for serialization/deserialization
@@ -25,71 +51,145 @@ class Caps:
 		"""Exception that throws when Type of a :type:`Caps.Value` is not what you were expecting"""
 		pass
 
-	__a: list[Caps.Value]
+	class LimitExceededError(CapsError):
+		"""Exception that throws when a frame goes over one of its :type:`CapsLimits`"""
+		pass
+
+	DEFAULT_LIMITS = CapsLimits()
+	"""Limits used when parsing without explicit :type:`CapsLimits`"""
+
+	__slots__ = ('__t', '__a', '__lazy')
+	__t: bytearray # type code of every member
+	__a: list[Any] # raw value of every member, Caps.Value's are only created when a member is accessed
+	__lazy: tuple # (view, offsets, readers, limits, depth) of members that are not decoded yet, or None
+
+	# Per-type member codecs, indexed by type code. These get filled in from the codec table below the class
+	_SIZERS: dict = None
+	_WRITERS: dict = None
+	_READERS: dict = None
+	_READERS_COPY: dict = None
+	_SKIPPERS: dict = None
 	
 	def write(self, value: Any = None) -> Caps:
 		"""Add a value to the Caps object"""
 		if isinstance(value, Caps.Value):
-			self.__a.append(value)
-		else:
-			self.__a.append(Caps.Value(None, value))
+			return self.__append(value.type(), value.getValueNoType())
+		return self.__append(Caps.Value._infer(value), value)
+	
+	def __append(self, vType: int, value: Any) -> Caps:
+		self.__t.append(vType)
+		self.__a.append(value)
 		return self
 	
 	def writeInt32(self, value: int) -> Caps:
 		"""Write an integer value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_INT32, int(value)))
+		return self.__append(Caps.Value.TYPE_INT32, int(value))
 	
 	def writeUInt32(self, value: int) -> Caps:
 		"""Write an unsigned integer value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_UINT32, int(value)))
+		return self.__append(Caps.Value.TYPE_UINT32, int(value))
 	
 	def writeInt64(self, value: int) -> Caps:
 		"""Write a long integer value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_INT64, int(value)))
+		return self.__append(Caps.Value.TYPE_INT64, int(value))
 	
 	def writeUInt64(self, value: int) -> Caps:
 		"""Write an unsigned long value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_UINT64, int(value)))
+		return self.__append(Caps.Value.TYPE_UINT64, int(value))
 	
 	def writeFloat(self, value: float) -> Caps:
 		"""Write a float value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_FLOAT, float(value)))
+		return self.__append(Caps.Value.TYPE_FLOAT, float(value))
 	
 	def writeDouble(self, value: float) -> Caps:
 		"""Write a double value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_DOUBLE, float(value)))
+		return self.__append(Caps.Value.TYPE_DOUBLE, float(value))
 	
 	def writeObject(self, value: Caps) -> Caps:
 		"""Write a nested :type:`Caps` object"""
-		return self.write(Caps.Value(Caps.Value.TYPE_OBJECT, value))
+		return self.__append(Caps.Value.TYPE_OBJECT, value)
 	
 	def writeVoid(self) -> Caps:
 		"""Write a void value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_VOID, None))
+		return self.__append(Caps.Value.TYPE_VOID, None)
 	
 	def writeString(self, value: str) -> Caps:
 		"""Write a string value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_STRING, str(value)))
+		return self.__append(Caps.Value.TYPE_STRING, str(value))
 	
 	def writeBoolean(self, value: bool) -> Caps:
 		"""Write a void value"""
-		return self.write(Caps.Value(Caps.Value.TYPE_UINT32, int(value)))
+		return self.__append(Caps.Value.TYPE_UINT32, int(value))
 	
 	def writeBinary(self, value: bytes) -> Caps:
 		"""Write binary data"""
-		return self.write(Caps.Value(Caps.Value.TYPE_BINARY, value))
+		return self.__append(Caps.Value.TYPE_BINARY, value)
+	
+	def writeInt32Array(self, values: Iterable[int]) -> Caps:
+		"""Write every value as an integer member, long runs get encoded in bulk"""
+		return self.__extend(Caps.Value.TYPE_INT32, values)
+	
+	def writeUInt32Array(self, values: Iterable[int]) -> Caps:
+		"""Write every value as an unsigned integer member, long runs get encoded in bulk"""
+		return self.__extend(Caps.Value.TYPE_UINT32, values)
+	
+	def writeInt64Array(self, values: Iterable[int]) -> Caps:
+		"""Write every value as a long integer member, long runs get encoded in bulk"""
+		return self.__extend(Caps.Value.TYPE_INT64, values)
+	
+	def writeUInt64Array(self, values: Iterable[int]) -> Caps:
+		"""Write every value as an unsigned long member, long runs get encoded in bulk"""
+		return self.__extend(Caps.Value.TYPE_UINT64, values)
+	
+	def __extend(self, vType: int, values: Iterable[int]) -> Caps:
+		# tolist() of a numpy array is much faster to iterate, but can still hold floats or bools
+		values = list(map(int, values.tolist() if hasattr(values, 'tolist') else values))
+		self.__t += bytes((vType,)) * len(values)
+		self.__a += values
+		return self
 	
 	def __init__(self, values: list[Caps.Value] = None):
-		self.__a: list[Caps.Value] = values or []
+		self.__t = bytearray()
+		self.__a = []
+		self.__lazy = None
+		for value in values or []:
+			self.write(value)
 	
 	@staticmethod
-	def fromBytes(data: bytes) -> tuple[Caps, bytes]:
-		"""Parse a new Caps object from bytes"""
+	def fromBytes(data: bytes, copyBinary: bool = False, limits: CapsLimits = None) -> tuple[Caps, bytes]:
+		"""Parse a new Caps object from bytes
+
+		:param bytes data: The frame to parse, can be any bytes-like object
+		:param bool copyBinary: Materialize ``TYPE_BINARY`` members as :type:`bytes` instead of :type:`memoryview` slices of ``data``
+		:param Optional[CapsLimits] limits: Limits for untrusted input, defaults to :attr:`Caps.DEFAULT_LIMITS`
+		"""
 		caps = Caps()
-		return caps.parse(data)
+		return caps.parse(data, copyBinary, limits)
+
+	@staticmethod
+	def fromBytesLazy(data: bytes, copyBinary: bool = False, limits: CapsLimits = None) -> tuple[Caps, bytes]:
+		"""Parse a new Caps object from bytes, but only decode members when they are accessed
+
+		Only the header and the descriptor table are decoded up front, the offset of every member is recorded,
+		and a member gets decoded the first time :func:`Caps.at` touches it. Nested objects are lazy too.
+		The returned Caps keeps a view of ``data``, so don't modify ``data`` while it's in use.
+		Limits of members are checked when they are decoded.
+
+		:param bytes data: The frame to parse, can be any bytes-like object
+		:param bool copyBinary: Materialize ``TYPE_BINARY`` members as :type:`bytes` instead of :type:`memoryview` slices of ``data``
+		:param Optional[CapsLimits] limits: Limits for untrusted input, defaults to :attr:`Caps.DEFAULT_LIMITS`
+		"""
+		if limits is None:
+			limits = Caps.DEFAULT_LIMITS
+		caps = Caps()
+		view = memoryview(data)
+		size = Caps._parse_header(view, limits)
+		caps._index_members(view, 5, size, Caps._readers(copyBinary, limits, size), limits, 0)
+		return caps, data[size:]
 
 	def __repr__(self) -> str:
-		return "Caps(%s)" % self.__a
+		self.__decode_all()
+		return "Caps(%s)" % [Caps.Value(vType, value) for vType, value in zip(self.__t, self.__a)]
 	
 	def dump(self) -> str:
 		return repr(self)
@@ -99,73 +199,270 @@ class Caps:
 		Serialize the Caps object to bytes
 		Format: [4 bytes size][1 byte version][member descriptors][member data]
 		"""
-		# First pass: serialize member descriptors and data
-		desc_buffer = BytesIO()
-		data_buffer = BytesIO()
-		
-		# Write member count as ULEB128
-		desc_buffer.write(Caps._encode_uleb128(len(self.__a)))
-		
-		# Write type descriptors
-		for member in self.__a:
-			if not isinstance(member, Caps.Value): continue
-			member_type = member.type()
-			desc_buffer.write(bytes([member_type]))
-		
-		# Write member data
-		for member in self.__a:
-			if not isinstance(member, Caps.Value): continue
-			Caps._serialize_member(member, data_buffer)
-		
-		# Combine everything
-		desc_data = desc_buffer.getvalue()
-		member_data = data_buffer.getvalue()
+		size = self.encodedSize()
+		if size >= _JOIN_MIN_SIZE and Caps.Value.TYPE_BINARY in self.__t:
+			large = [index for index, (vType, value) in enumerate(zip(self.__t, self.__a))
+				if vType == Caps.Value.TYPE_BINARY and memoryview(value).nbytes >= _JOIN_MIN_SIZE]
+			if large:
+				return self.__join(size, large)
+		buffer = bytearray(size)
+		self.__write(buffer, 0)
+		return bytes(buffer)
+	
+	def __join(self, size: int, large: list[int]) -> bytes:
+		"""Serialize with the large binary members joined in, instead of being copied into a buffer that gets copied again"""
+		types = self.__t
+		values = self.__a
+		sizers = Caps._SIZERS
+		writers = Caps._WRITERS
+		head = bytearray(5 + Caps._uleb128_size(len(values)) + len(types))
+		_UINT32_BE.pack_into(head, 0, size)
+		head[4] = Caps.CAPS_VERSION
+		offset = Caps._write_uleb128(head, 5, len(values))
+		head[offset:] = types
+		pieces = [head]
+		start = 0
+		for index in large + [len(values)]:
+			# The members in front of a large binary and its length prefix go into one segment
+			members = tuple(zip(types[start:index], values[start:index]))
+			data = memoryview(values[index]).cast('B') if index < len(values) else None
+			segment = bytearray(sum(sizers[vType](value) for vType, value in members) + (0 if data is None else Caps._uleb128_size(len(data))))
+			offset = 0
+			for vType, value in members:
+				offset = writers[vType](segment, offset, value)
+			pieces.append(segment)
+			if data is not None:
+				Caps._write_uleb128(segment, offset, len(data))
+				pieces.append(data)
+			start = index + 1
+		return b''.join(pieces)
+	
+	def serializeInto(self, buffer: bytearray, offset: int = 0) -> int:
+		"""Serialize the Caps object into an existing buffer, so one buffer can be reused for multiple packets
+
+		:param bytearray buffer: The buffer to write into, a :type:`bytearray` gets extended when it's too small
+		:param int offset: The position in the buffer to start writing at
+		:returns: The number of bytes written
+		"""
+		size = self.encodedSize()
+		Caps._reserve(buffer, offset + size)
+		return self.__write(buffer, offset) - offset
+	
+	def encodedSize(self) -> int:
+		"""Return the exact number of bytes :func:`Caps.serialize` will produce"""
+		self.__decode_all()
+		sizers = Caps._SIZERS
+		size = 5 + Caps._uleb128_size(len(self.__a)) + len(self.__a)
+		types = self.__t
+		values = self.__a
+		index = 0
+		for run_start, run_stop in _find_bulk_runs(types):
+			for vType, value in zip(types[index:run_start], values[index:run_start]):
+				sizer = sizers.get(vType)
+				if sizer is None:
+					raise Caps.CapsError("Unknown member type: %d" % (vType))
+				size += sizer(value)
+			size += _leb128_array_size(types[run_start] in _SIGNED_TYPES, values[run_start:run_stop])
+			index = run_stop
+		if index:
+			types = types[index:]
+			values = values[index:]
+		for vType, value in zip(types, values):
+			sizer = sizers.get(vType)
+			if sizer is None:
+				raise Caps.CapsError("Unknown member type: %d" % (vType))
+			size += sizer(value)
+		return size
+	
+	def __write(self, buffer: bytearray, offset: int) -> int:
+		"""Write the header, descriptors and member data at offset, returns the new offset"""
+		self.__decode_all()
+		start = offset
+		buffer[start + 4] = Caps.CAPS_VERSION
+		offset = Caps._write_uleb128(buffer, start + 5, len(self.__a))
 		
-		total_size = 5 + len(desc_data) + len(member_data)
+		# The type codes are stored the way they are serialized
+		buffer[offset:offset + len(self.__t)] = self.__t
+		offset += len(self.__t)
 		
-		result = BytesIO()
-		result.write(struct_pack('>I', total_size))  # Big-endian size
-		result.write(bytes([Caps.CAPS_VERSION]))
-		result.write(desc_data)
-		result.write(member_data)
+		# Write member data, nested objects are written in place and long integer runs in bulk
+		writers = Caps._WRITERS
+		types = self.__t
+		values = self.__a
+		index = 0
+		for run_start, run_stop in _find_bulk_runs(types):
+			for vType, value in zip(types[index:run_start], values[index:run_start]):
+				offset = writers[vType](buffer, offset, value)
+			offset = _write_leb128_array(types[run_start] in _SIGNED_TYPES, buffer, offset, values[run_start:run_stop])
+			index = run_stop
+		if index:
+			types = types[index:]
+			values = values[index:]
+		for vType, value in zip(types, values):
+			offset = writers[vType](buffer, offset, value)
 		
-		return result.getvalue()
+		# The size is only known now, so patch it into the header
+		_UINT32_BE.pack_into(buffer, start, offset - start)
+		return offset
 	
-	def parse(self, data: bytes) -> tuple['Caps', bytes]:
-		"""Parse a bytes to the current Caps object"""
-		if len(data) < 5:
+	def parse(self, data: bytes, copyBinary: bool = False, limits: CapsLimits = None) -> tuple['Caps', bytes]:
+		"""Parse a bytes to the current Caps object
+
+		The frame is walked through a :type:`memoryview` with a moving offset, so nothing gets copied
+		except for the decoded values themselves. ``TYPE_BINARY`` members are returned as views into ``data``,
+		unless ``copyBinary`` is set.
+
+		:param bytes data: The frame to parse, can be any bytes-like object
+		:param bool copyBinary: Materialize ``TYPE_BINARY`` members as :type:`bytes` instead of :type:`memoryview` slices of ``data``
+		:param Optional[CapsLimits] limits: Limits for untrusted input, defaults to :attr:`Caps.DEFAULT_LIMITS`
+		:raises Caps.LimitExceededError: When the frame goes over one of the limits
+		"""
+		if limits is None:
+			limits = Caps.DEFAULT_LIMITS
+		view = memoryview(data)
+		size = Caps._parse_header(view, limits)
+		self.__decode_all()
+		self._parse_members(view, 5, size, Caps._readers(copyBinary, limits, size), limits, 0)
+
+		return self, data[size:] # return the unparsed bytes ;)
+	
+	@staticmethod
+	def _reserve(buffer: bytearray, end: int) -> None:
+		"""Make sure buffer is at least end bytes long, only a :type:`bytearray` can be extended"""
+		if len(buffer) < end:
+			if not isinstance(buffer, bytearray):
+				raise Caps.CapsError("Buffer too small: need %d, got %d" % (end, len(buffer)))
+			buffer.extend(bytes(end - len(buffer)))
+	
+	@staticmethod
+	def _parse_header(view: memoryview, limits: CapsLimits) -> int:
+		"""Validate the frame header, returns the frame size"""
+		if len(view) < 5:
 			raise Caps.CapsError("Data too small")
 		
-		# Parse header
-		size = struct_unpack('>I', data[0:4])[0]
-		version = data[4]
+		size = _UINT32_BE.unpack_from(view, 0)[0]
+		version = view[4]
 		
 		if version != Caps.CAPS_VERSION:
 			raise Caps.CapsError("Unsupported version: %d" % (version))
 		
-		if size > len(data):
-			raise Caps.CapsError("Size mismatch: expected %d, got %d" % (size, len(data)))
+		if size > limits.maxFrameSize:
+			raise Caps.LimitExceededError("Frame too large: %d, limit is %d" % (size, limits.maxFrameSize))
 		
-		# Parse members
-		buffer = BytesIO(data[5:])
+		if size > len(view):
+			raise Caps.CapsError("Size mismatch: expected %d, got %d" % (size, len(view)))
+		return size
+	
+	@staticmethod
+	def _readers(copyBinary: bool, limits: CapsLimits, size: int) -> dict:
+		"""Return the reader table for a frame of size bytes"""
+		readers = Caps._READERS_COPY if copyBinary else Caps._READERS
+		if limits.maxBinaryLength >= size:
+			return readers # a binary member can never be longer than the frame it's in
 		
-		# Read member count
-		member_count, bytes_read = Caps._decode_uleb128(buffer)
+		read_binary = readers[Caps.Value.TYPE_BINARY]
+		maxBinaryLength = limits.maxBinaryLength
+		def read_binary_limited(view: memoryview, offset: int, end: int) -> tuple[bytes, int]:
+			length, _ = Caps._decode_uleb128(view, offset, end)
+			if length > maxBinaryLength:
+				raise Caps.LimitExceededError("Binary too large: %d, limit is %d" % (length, maxBinaryLength))
+			return read_binary(view, offset, end)
 		
-		# Read type descriptors
-		descriptors = []
-		for _ in range(member_count):
-			desc = buffer.read(1)
-			if not desc:
-				raise Caps.CapsError("Truncated descriptor data")
-			descriptors.append(desc[0])
+		readers = dict(readers)
+		readers[Caps.Value.TYPE_BINARY] = read_binary_limited
+		return readers
+	
+	@staticmethod
+	def __read_count(view: memoryview, offset: int, end: int, limits: CapsLimits) -> tuple[int, int]:
+		"""Read the member count, returns the count and the offset of the descriptors"""
+		member_count, offset = Caps._decode_uleb128(view, offset, end)
+		if member_count > limits.maxMembers:
+			raise Caps.LimitExceededError("Too many members: %d, limit is %d" % (member_count, limits.maxMembers))
+		if offset + member_count > end:
+			raise Caps.CapsError("Truncated descriptor data")
+		return member_count, offset
+	
+	def _parse_members(self, view: memoryview, offset: int, end: int, readers: dict, limits: CapsLimits, depth: int) -> int:
+		"""Parse the member count, descriptors and member data between offset and end, returns the new offset"""
+		# Read member count and type descriptors
+		member_count, offset = Caps.__read_count(view, offset, end, limits)
+		descriptors = view[offset:offset + member_count]
+		offset += member_count
 		
-		# Read member data
+		# Read member data, long integer runs are decoded in bulk
+		values = self.__a
+		index = 0
+		for run_start, run_stop in _find_bulk_runs(descriptors):
+			offset = Caps.__read_members(readers, limits, depth, descriptors[index:run_start], view, offset, end, values)
+			run, offset = _decode_leb128_array(descriptors[run_start] in _SIGNED_TYPES, view, offset, end, run_stop - run_start)
+			values += run
+			index = run_stop
+		offset = Caps.__read_members(readers, limits, depth, descriptors[index:], view, offset, end, values)
+		self.__t += descriptors
+		return offset
+	
+	@staticmethod
+	def __read_members(readers: dict, limits: CapsLimits, depth: int, descriptors: memoryview, view: memoryview, offset: int, end: int, values: list) -> int:
 		for desc in descriptors:
-			value = Caps._parse_member(desc, buffer)
-			self.__a.append(Caps.Value(desc, value))
-
-		return self, data[size:] # return the unparsed bytes ;)
+			reader = readers.get(desc)
+			if reader is not None:
+				value, offset = reader(view, offset, end)
+			elif desc == Caps.Value.TYPE_OBJECT:
+				# Parse the nested caps in place, its size header includes itself
+				object_end = Caps._skip_object(view, offset, end)
+				if depth >= limits.maxDepth:
+					raise Caps.LimitExceededError("Objects nested too deep, limit is %d" % (limits.maxDepth))
+				value = Caps()
+				value._parse_members(view, offset + 5, object_end, readers, limits, depth + 1)
+				offset = object_end
+			else:
+				raise Caps.CapsError("Unknown member type: %d" % (desc))
+			values.append(value)
+		return offset
+	
+	def _index_members(self, view: memoryview, offset: int, end: int, readers: dict, limits: CapsLimits, depth: int) -> int:
+		"""Read the member count and descriptors between offset and end and record where each member starts, returns the new offset"""
+		member_count, offset = Caps.__read_count(view, offset, end, limits)
+		descriptors = view[offset:offset + member_count]
+		offset += member_count
+		
+		skippers = Caps._SKIPPERS
+		offsets = []
+		for desc in descriptors:
+			skipper = skippers.get(desc)
+			if skipper is None:
+				raise Caps.CapsError("Unknown member type: %d" % (desc))
+			offsets.append(offset)
+			offset = skipper(view, offset, end)
+		
+		self.__lazy = (view, offsets, readers, limits, depth)
+		self.__t = bytearray(descriptors)
+		self.__a = [_PENDING] * member_count
+		return offset
+	
+	def __decode(self, index: int) -> Any:
+		"""Decode a member that has been indexed by :func:`Caps._index_members`, returns its value"""
+		view, offsets, readers, limits, depth = self.__lazy
+		desc = self.__t[index]
+		offset = offsets[index]
+		if desc == Caps.Value.TYPE_OBJECT:
+			if depth >= limits.maxDepth:
+				raise Caps.LimitExceededError("Objects nested too deep, limit is %d" % (limits.maxDepth))
+			value = Caps()
+			value._index_members(view, offset + 5, offset + _UINT32_BE.unpack_from(view, offset)[0], readers, limits, depth + 1)
+		else:
+			value, _ = readers[desc](view, offset, len(view))
+		self.__a[index] = value
+		return value
+	
+	def __decode_all(self) -> None:
+		"""Decode all members that are still pending"""
+		if self.__lazy is None:
+			return
+		for index in range(len(self.__lazy[1])):
+			if self.__a[index] is _PENDING:
+				self.__decode(index)
+		self.__lazy = None
 	
 	def __len__(self) -> int:
 		"""Return the number of members"""
@@ -179,15 +476,46 @@ class Caps:
 		"""Get member value by index"""
 		if index < 0 or index >= len(self.__a):
 			raise IndexError("Index out of range")
-		return self.__a[index]
+		value = self.__a[index]
+		if value is _PENDING:
+			value = self.__decode(index)
+		return Caps.Value(self.__t[index], value)
 	
 	def at(self, index: int) -> Caps.Value:
 		"""Get member value by index"""
 		return self.__getitem__(index)
 	
+	def readInt32Array(self, index: int = 0, count: int = None) -> list[int]:
+		"""Validate that count members starting at index are INT32 and return their values"""
+		return self.__slice(Caps.Value.TYPE_INT32, index, count)
+	
+	def readUInt32Array(self, index: int = 0, count: int = None) -> list[int]:
+		"""Validate that count members starting at index are UINT32 and return their values"""
+		return self.__slice(Caps.Value.TYPE_UINT32, index, count)
+	
+	def readInt64Array(self, index: int = 0, count: int = None) -> list[int]:
+		"""Validate that count members starting at index are INT64 and return their values"""
+		return self.__slice(Caps.Value.TYPE_INT64, index, count)
+	
+	def readUInt64Array(self, index: int = 0, count: int = None) -> list[int]:
+		"""Validate that count members starting at index are UINT64 and return their values"""
+		return self.__slice(Caps.Value.TYPE_UINT64, index, count)
+	
+	def __slice(self, vType: int, index: int, count: int) -> list[int]:
+		if count is None:
+			count = len(self.__a) - index
+		if index < 0 or count < 0 or index + count > len(self.__a):
+			raise IndexError("Index out of range")
+		if self.__t[index:index + count] != bytes((vType,)) * count:
+			raise Caps.IncorrectTypeException()
+		self.__decode_all()
+		return self.__a[index:index + count]
+	
 	def clear(self) -> None:
 		"""Clear all members"""
+		self.__t.clear()
 		self.__a.clear()
+		self.__lazy = None
 	
 	def __str__(self) -> str:
 		return self.dump()
@@ -196,78 +524,145 @@ class Caps:
 		return self.dump()
 	
 	@staticmethod
-	def _serialize_member(member: Caps.Value, buffer: BytesIO) -> None:
-		"""Serialize a single member's data"""
-		member_type = member.type()
-		value = member.getValueNoType()
-		
-		if member_type == Caps.Value.TYPE_VOID:
-			pass  # No data
-		elif member_type == Caps.Value.TYPE_INT32:
-			buffer.write(Caps._encode_sleb128(value))
-		elif member_type == Caps.Value.TYPE_UINT32:
-			buffer.write(Caps._encode_uleb128(value))
-		elif member_type == Caps.Value.TYPE_FLOAT:
-			buffer.write(struct_pack('<f', value))
-		elif member_type == Caps.Value.TYPE_INT64:
-			buffer.write(Caps._encode_sleb128(value))
-		elif member_type == Caps.Value.TYPE_UINT64:
-			buffer.write(Caps._encode_uleb128(value))
-		elif member_type == Caps.Value.TYPE_DOUBLE:
-			buffer.write(struct_pack('<d', value))
-		elif member_type == Caps.Value.TYPE_STRING:
-			encoded = value.encode('utf-8')
-			buffer.write(Caps._encode_uleb128(len(encoded)))
-			buffer.write(encoded)
-		elif member_type == Caps.Value.TYPE_BINARY:
-			buffer.write(Caps._encode_uleb128(len(value)))
-			buffer.write(value)
-		elif member_type == Caps.Value.TYPE_OBJECT:
-			nested_data = value.serialize()
-			buffer.write(nested_data)
-		else:
-			raise Caps.CapsError("Unknown member type: %d" % (member_type))
-	
-	@staticmethod
-	def _parse_member(member_type: chr, buffer: BytesIO) -> Any:
-		"""Parse a single member from the buffer"""
-		if member_type == Caps.Value.TYPE_VOID:
-			return None
-		elif member_type == Caps.Value.TYPE_INT32:
-			value, _ = Caps._decode_sleb128(buffer)
-			return value
-		elif member_type == Caps.Value.TYPE_UINT32:
-			value, _ = Caps._decode_uleb128(buffer)
-			return value
-		elif member_type == Caps.Value.TYPE_FLOAT:
-			data = buffer.read(4)
-			return struct_unpack('<f', data)[0]
-		elif member_type == Caps.Value.TYPE_INT64:
-			value, _ = Caps._decode_sleb128(buffer)
-			return value
-		elif member_type == Caps.Value.TYPE_UINT64:
-			value, _ = Caps._decode_uleb128(buffer)
-			return value
-		elif member_type == Caps.Value.TYPE_DOUBLE:
-			data = buffer.read(8)
-			return struct_unpack('<d', data)[0]
-		elif member_type == Caps.Value.TYPE_STRING:
-			length, _ = Caps._decode_uleb128(buffer)
-			data = buffer.read(length)
-			return data.decode('utf-8')
-		elif member_type == Caps.Value.TYPE_BINARY:
-			length, _ = Caps._decode_uleb128(buffer)
-			return buffer.read(length)
-		elif member_type == Caps.Value.TYPE_OBJECT:
-			# Read size header
-			size_data = buffer.read(4)
-			size = struct_unpack('>I', size_data)[0]
-			# Read rest of caps data
-			caps_data = size_data + buffer.read(size - 4)
-			cls, _ = Caps.fromBytes(caps_data)
-			return cls
-		else:
-			raise Caps.CapsError("Unknown member type: %d" % (member_type))
+	def _size_void(value: None) -> int:
+		return 0
+	
+	@staticmethod
+	def _size_float(value: float) -> int:
+		return 4
+	
+	@staticmethod
+	def _size_double(value: float) -> int:
+		return 8
+	
+	@staticmethod
+	def _size_string(value: str) -> int:
+		length = len(value) if value.isascii() else len(value.encode('utf-8'))
+		return Caps._uleb128_size(length) + length
+	
+	@staticmethod
+	def _size_binary(value: bytes) -> int:
+		length = memoryview(value).nbytes
+		return Caps._uleb128_size(length) + length
+	
+	@staticmethod
+	def _size_object(value: Caps) -> int:
+		return value.encodedSize()
+	
+	@staticmethod
+	def _write_void(buffer: bytearray, offset: int, value: None) -> int:
+		return offset  # No data
+	
+	@staticmethod
+	def _write_float(buffer: bytearray, offset: int, value: float) -> int:
+		_FLOAT_LE.pack_into(buffer, offset, value)
+		return offset + 4
+	
+	@staticmethod
+	def _write_double(buffer: bytearray, offset: int, value: float) -> int:
+		_DOUBLE_LE.pack_into(buffer, offset, value)
+		return offset + 8
+	
+	@staticmethod
+	def _write_string(buffer: bytearray, offset: int, value: str) -> int:
+		encoded = value.encode('utf-8')
+		offset = Caps._write_uleb128(buffer, offset, len(encoded))
+		buffer[offset:offset + len(encoded)] = encoded
+		return offset + len(encoded)
+	
+	@staticmethod
+	def _write_binary(buffer: bytearray, offset: int, value: bytes) -> int:
+		value = memoryview(value).cast('B')
+		offset = Caps._write_uleb128(buffer, offset, len(value))
+		buffer[offset:offset + len(value)] = value
+		return offset + len(value)
+	
+	@staticmethod
+	def _write_object(buffer: bytearray, offset: int, value: Caps) -> int:
+		return value.__write(buffer, offset)
+	
+	@staticmethod
+	def _read_void(view: memoryview, offset: int, end: int) -> tuple[None, int]:
+		return None, offset
+	
+	@staticmethod
+	def _read_float(view: memoryview, offset: int, end: int) -> tuple[float, int]:
+		if offset + 4 > end:
+			raise Caps.CapsError("Truncated float")
+		return _FLOAT_LE.unpack_from(view, offset)[0], offset + 4
+	
+	@staticmethod
+	def _read_double(view: memoryview, offset: int, end: int) -> tuple[float, int]:
+		if offset + 8 > end:
+			raise Caps.CapsError("Truncated double")
+		return _DOUBLE_LE.unpack_from(view, offset)[0], offset + 8
+	
+	@staticmethod
+	def _read_string(view: memoryview, offset: int, end: int) -> tuple[str, int]:
+		length, offset = Caps._decode_uleb128(view, offset, end)
+		if offset + length > end:
+			raise Caps.CapsError("Truncated string")
+		try:
+			return str(view[offset:offset + length], 'utf-8'), offset + length
+		except UnicodeDecodeError:
+			raise Caps.CapsError("Invalid UTF-8 string") from None
+	
+	@staticmethod
+	def _read_binary(view: memoryview, offset: int, end: int) -> tuple[memoryview, int]:
+		length, offset = Caps._decode_uleb128(view, offset, end)
+		if offset + length > end:
+			raise Caps.CapsError("Truncated binary")
+		return view[offset:offset + length], offset + length
+	
+	@staticmethod
+	def _read_binary_copy(view: memoryview, offset: int, end: int) -> tuple[bytes, int]:
+		length, offset = Caps._decode_uleb128(view, offset, end)
+		if offset + length > end:
+			raise Caps.CapsError("Truncated binary")
+		return bytes(view[offset:offset + length]), offset + length
+	
+	@staticmethod
+	def _skip_void(view: memoryview, offset: int, end: int) -> int:
+		return offset
+	
+	@staticmethod
+	def _skip_leb128(view: memoryview, offset: int, end: int) -> int:
+		while True:
+			if offset >= end:
+				raise Caps.CapsError("Truncated LEB128")
+			offset += 1
+			if view[offset - 1] & 0x80 == 0:
+				return offset
+	
+	@staticmethod
+	def _skip_float(view: memoryview, offset: int, end: int) -> int:
+		if offset + 4 > end:
+			raise Caps.CapsError("Truncated float")
+		return offset + 4
+	
+	@staticmethod
+	def _skip_double(view: memoryview, offset: int, end: int) -> int:
+		if offset + 8 > end:
+			raise Caps.CapsError("Truncated double")
+		return offset + 8
+	
+	@staticmethod
+	def _skip_sized(view: memoryview, offset: int, end: int) -> int:
+		length, offset = Caps._decode_uleb128(view, offset, end)
+		if offset + length > end:
+			raise Caps.CapsError("Truncated member data")
+		return offset + length
+	
+	@staticmethod
+	def _skip_object(view: memoryview, offset: int, end: int) -> int:
+		if offset + 5 > end:
+			raise Caps.CapsError("Truncated object")
+		size = _UINT32_BE.unpack_from(view, offset)[0]
+		if view[offset + 4] != Caps.CAPS_VERSION:
+			raise Caps.CapsError("Unsupported version: %d" % (view[offset + 4]))
+		if size < 5 or offset + size > end:
+			raise Caps.CapsError("Size mismatch: expected %d, got %d" % (size, end - offset))
+		return offset + size
 	
 	@staticmethod
 	def _encode_uleb128(value: int) -> bytes:
@@ -287,18 +682,39 @@ class Caps:
 		return bytes(result)
 	
 	@staticmethod
-	def _decode_uleb128(buffer: BytesIO) -> tuple[int, int]:
-		"""Decode ULEB128 from buffer, returns (value, bytes_read)"""
+	def _uleb128_size(value: int) -> int:
+		"""Return the number of bytes needed to encode value as ULEB128"""
+		if value < 0:
+			raise ValueError("ULEB128 requires non-negative value")
+		return (value.bit_length() + 6) // 7 or 1
+	
+	@staticmethod
+	def _write_uleb128(buffer: bytearray, offset: int, value: int) -> int:
+		"""Write value as ULEB128 at offset, returns the new offset"""
+		if value < 0:
+			raise ValueError("ULEB128 requires non-negative value")
+		while value > 0x7F:
+			buffer[offset] = (value & 0x7F) | 0x80
+			value >>= 7
+			offset += 1
+		buffer[offset] = value
+		return offset + 1
+	
+	@staticmethod
+	def _decode_uleb128(data: memoryview, offset: int = 0, end: int = None) -> tuple[int, int]:
+		"""Decode ULEB128 from data at offset, returns (value, new offset)"""
+		if end is None:
+			end = len(data)
+		if offset < end and data[offset] < 0x80:
+			return data[offset], offset + 1
 		result = 0
 		shift = 0
-		bytes_read = 0
 		
 		while True:
-			byte_data = buffer.read(1)
-			if not byte_data:
+			if offset >= end:
 				raise Caps.CapsError("Truncated ULEB128")
-			byte = byte_data[0]
-			bytes_read += 1
+			byte = data[offset]
+			offset += 1
 			
 			result |= (byte & 0x7F) << shift
 			shift += 7
@@ -309,7 +725,7 @@ class Caps:
 			if shift >= 64:
 				raise Caps.CapsError("ULEB128 too large")
 				
-		return result, bytes_read
+		return result, offset
 	
 	@staticmethod
 	def _encode_sleb128(value: int) -> bytes:
@@ -330,28 +746,46 @@ class Caps:
 		return bytes(result)
 	
 	@staticmethod
-	def _decode_sleb128(buffer: BytesIO) -> tuple[int, int]:
-		"""Decode SLEB128 from buffer, returns (value, bytes_read)"""
+	def _sleb128_size(value: int) -> int:
+		"""Return the number of bytes needed to encode value as SLEB128"""
+		return ((value if value >= 0 else ~value).bit_length() + 7) // 7
+	
+	@staticmethod
+	def _write_sleb128(buffer: bytearray, offset: int, value: int) -> int:
+		"""Write value as SLEB128 at offset, returns the new offset"""
+		while not -0x40 <= value < 0x40:
+			buffer[offset] = (value & 0x7F) | 0x80
+			value >>= 7
+			offset += 1
+		buffer[offset] = value & 0x7F
+		return offset + 1
+	
+	@staticmethod
+	def _decode_sleb128(data: memoryview, offset: int = 0, end: int = None) -> tuple[int, int]:
+		"""Decode SLEB128 from data at offset, returns (value, new offset)"""
+		if end is None:
+			end = len(data)
+		if offset < end and data[offset] < 0x80:
+			byte = data[offset]
+			return (byte - 0x80 if byte & 0x40 else byte), offset + 1
 		result = 0
 		shift = 0
-		bytes_read = 0
 		byte = 0x80
 		
 		while (byte & 0x80) != 0:
-			byte_data = buffer.read(1)
-			if not byte_data:
+			if offset >= end:
 				raise Caps.CapsError("Truncated SLEB128")
-			byte = byte_data[0]
-			bytes_read += 1
+			byte = data[offset]
+			offset += 1
 			
 			result |= (byte & 0x7F) << shift
 			shift += 7
 			
 		# Sign extend
-		if shift < 64 and (byte & 0x40) != 0:
+		if (byte & 0x40) != 0:
 			result |= -(1 << shift)
 			
-		return result, bytes_read
+		return result, offset
 
 	class Value:
 		"""Represents a single value in :type:`Caps` format"""
@@ -366,84 +800,468 @@ class Caps:
 		TYPE_BINARY = ord('B')  # 0x42
 		TYPE_OBJECT = ord('O')  # 0x4f
 		
+		__slots__ = ('__vType', '__a')
+
 		def __init__(self, vType: chr = None, value: Any = None):
-			self.__vType = vType
+			self.__vType = vType or Caps.Value._infer(value)
 			self.__a = value
 		
 		def type(self) -> chr:
-			"""Determine the type code for this value"""
-			if self.__vType:
-				return self.__vType
-				
-			if self.__a is None:
-				return Caps.Value.TYPE_VOID
-			elif isinstance(self.__a, bool):
+			"""Return the type code for this value"""
+			return self.__vType
+		
+		@staticmethod
+		def _infer(value: Any) -> chr:
+			"""Determine the type code for a value without explicit type"""
+			vType = Caps.Value._INFER.get(type(value))
+			if vType is not None:
+				return vType
+			if isinstance(value, bool):
 				return Caps.Value.TYPE_UINT32
-			elif isinstance(self.__a, int):
-				if -2**31 <= self.__a < 2**31:
+			elif isinstance(value, int):
+				if -2**31 <= value < 2**31:
 					return Caps.Value.TYPE_INT32
-				elif 0 <= self.__a < 2**32:
+				elif 0 <= value < 2**32:
 					return Caps.Value.TYPE_UINT32
-				elif -2**63 <= self.__a < 2**63:
+				elif -2**63 <= value < 2**63:
 					return Caps.Value.TYPE_INT64
 				else:
 					return Caps.Value.TYPE_UINT64
-			elif isinstance(self.__a, float):
-				return Caps.Value.TYPE_FLOAT # Or double
-			elif isinstance(self.__a, str):
-				return Caps.Value.TYPE_STRING
-			elif isinstance(self.__a, (bytes, bytearray)):
-				return Caps.Value.TYPE_BINARY
-			elif isinstance(self.__a, Caps):
-				return Caps.Value.TYPE_OBJECT
-			else:
-				raise CapsError("Unsupported type: %s" % (type(self.__a)))
+			for cls, vType in Caps.Value._INFER.items():
+				if isinstance(value, cls):
+					return vType
+			raise Caps.CapsError("Unsupported type: %s" % (type(value)))
 
 		def getValueNoType(self) -> Any:
 			return self.__a
 
 		def getInt(self) -> int:
 			"""Validate if value is int/IN32/UINT32 and return it"""
-			if self.type() == Caps.Value.TYPE_INT32 or self.type() == Caps.Value.TYPE_UINT32: return int(self.__a)
+			if self.__vType == Caps.Value.TYPE_INT32 or self.__vType == Caps.Value.TYPE_UINT32: return int(self.__a)
 			raise Caps.IncorrectTypeException()
 		
 		def getLong(self) -> int:
 			"""Validate if value is long/INT64/UINT64 and return it"""
-			if self.type() == Caps.Value.TYPE_INT64 or self.type() == Caps.Value.TYPE_UINT64: return int(self.__a)
+			if self.__vType == Caps.Value.TYPE_INT64 or self.__vType == Caps.Value.TYPE_UINT64: return int(self.__a)
 			raise Caps.IncorrectTypeException()
 		
 		def getFloat(self) -> float:
 			"""Validate if value is float/FLOAT and return it"""
-			if self.type() == Caps.Value.TYPE_FLOAT: return float(self.__a)
+			if self.__vType == Caps.Value.TYPE_FLOAT: return float(self.__a)
 			raise Caps.IncorrectTypeException()
 		
 		def getDouble(self) -> float:
 			"""Validate if value is float/DOUBLE and return it"""
-			if self.type() == Caps.Value.TYPE_DOUBLE: return float(self.__a)
+			if self.__vType == Caps.Value.TYPE_DOUBLE: return float(self.__a)
 			raise Caps.IncorrectTypeException()
 		
 		def getString(self) -> str:
 			"""Validate if value is str/STRING and return it"""
-			if self.type() == Caps.Value.TYPE_STRING: return str(self.__a)
+			if self.__vType == Caps.Value.TYPE_STRING: return str(self.__a)
 			raise Caps.IncorrectTypeException()
 		
 		def getBinary(self) -> bytes:
 			"""Validate if value is bytes/BINARY and return it"""
-			if self.type() == Caps.Value.TYPE_BINARY: return bytes(self.__a)
+			if self.__vType == Caps.Value.TYPE_BINARY: return bytes(self.__a)
+			raise Caps.IncorrectTypeException()
+		
+		def getBinaryView(self) -> memoryview:
+			"""Validate if value is bytes/BINARY and return it as a :type:`memoryview`, without copying"""
+			if self.__vType == Caps.Value.TYPE_BINARY: return memoryview(self.__a)
 			raise Caps.IncorrectTypeException()
 		
 		def getObject(self) -> Caps:
 			"""Validate if value is Caps/OBJECT and return it"""
-			if self.type() == Caps.Value.TYPE_OBJECT: return self.__a
+			if self.__vType == Caps.Value.TYPE_OBJECT: return self.__a
 			raise Caps.IncorrectTypeException()
 
 		def __repr__(self) -> str:
-			current_type = self.type()
+			current_type = self.__vType
 			a = [i for i in Caps.Value.__dict__.items() if i[1] == current_type]
 			type_string = 'Caps.Value.' + a[0][0] if len(a) == 1 else current_type
-			value_string = "'" + str(self.__a) + "'" if current_type == Caps.Value.TYPE_STRING else str(self.__a)
+			value = bytes(self.__a) if isinstance(self.__a, memoryview) else self.__a
+			value_string = "'" + str(value) + "'" if current_type == Caps.Value.TYPE_STRING else str(value)
 			return "Caps.Value(value=%s, vType=%s)" % (value_string, type_string)
 
+# Placeholder for lazily parsed members that are not decoded yet
+_PENDING = object()
+
+# Binary members of at least this many bytes get joined into the serialized frame instead of copied into its buffer first
+_JOIN_MIN_SIZE = 16 * 1024
+
+# Runs of at least this many members of one integer type get encoded and decoded in bulk
+_BULK_MIN_RUN = 64
+_BULK_RUN_PATTERN = re.compile(b'|'.join(re.escape(bytes((vType,))) + b'{%d,}' % _BULK_MIN_RUN for vType in (
+	Caps.Value.TYPE_INT32, Caps.Value.TYPE_UINT32, Caps.Value.TYPE_INT64, Caps.Value.TYPE_UINT64)))
+_SIGNED_TYPES = (Caps.Value.TYPE_INT32, Caps.Value.TYPE_INT64)
+
+def _find_bulk_runs(types: bytes) -> list[tuple[int, int]]:
+	"""Return (start, stop) of every long run of one integer type in a descriptor table"""
+	if len(types) < _BULK_MIN_RUN:
+		return []
+	return [match.span() for match in _BULK_RUN_PATTERN.finditer(types)]
+
+def _leb128_array_size(signed: bool, values: list[int]) -> int:
+	"""Return the number of bytes needed to encode all values as SLEB128 or ULEB128"""
+	if numpy is not None:
+		try:
+			return int(_numpy_leb128_sizes(signed, numpy.array(values, dtype=numpy.int64 if signed else numpy.uint64)).sum())
+		except OverflowError:
+			pass # Doesn't fit in 64 bits, let the pure python path handle it
+	size = Caps._sleb128_size if signed else Caps._uleb128_size
+	return sum(map(size, values))
+
+def _numpy_leb128_sizes(signed: bool, values: numpy.ndarray) -> numpy.ndarray:
+	if signed:
+		values = numpy.where(values < 0, ~values, values) # number of bits without the sign
+		limits = [numpy.int64(1) << (7 * n - 1) for n in range(1, 10)]
+	else:
+		limits = [numpy.uint64(1) << numpy.uint64(7 * n) for n in range(1, 10)]
+	sizes = numpy.ones(len(values), dtype=numpy.int64)
+	for limit in limits:
+		sizes += values >= limit
+	return sizes
+
+def _write_leb128_array(signed: bool, buffer: bytearray, offset: int, values: list[int]) -> int:
+	"""Write all values as SLEB128 or ULEB128 back to back at offset, returns the new offset"""
+	if numpy is not None:
+		try:
+			array = numpy.array(values, dtype=numpy.int64 if signed else numpy.uint64)
+		except OverflowError:
+			pass # Doesn't fit in 64 bits, let the pure python path handle it
+		else:
+			sizes = _numpy_leb128_sizes(signed, array)
+			starts = numpy.cumsum(sizes) - sizes
+			result = numpy.empty(int(sizes.sum()), dtype=numpy.uint8)
+			for n in range(int(sizes.max()) if len(sizes) else 0):
+				selected = sizes > n
+				byte = ((array[selected] >> (7 * n if signed else numpy.uint64(7 * n))) & 0x7F).astype(numpy.uint8)
+				byte |= (sizes[selected] > n + 1).astype(numpy.uint8) << 7 # continuation bit on all but the last byte
+				result[starts[selected] + n] = byte
+			buffer[offset:offset + len(result)] = result.data
+			return offset + len(result)
+
+	if signed:
+		for value in values:
+			while not -0x40 <= value < 0x40:
+				buffer[offset] = (value & 0x7F) | 0x80
+				value >>= 7
+				offset += 1
+			buffer[offset] = value & 0x7F
+			offset += 1
+	else:
+		for value in values:
+			if value < 0:
+				raise ValueError("ULEB128 requires non-negative value")
+			while value > 0x7F:
+				buffer[offset] = (value & 0x7F) | 0x80
+				value >>= 7
+				offset += 1
+			buffer[offset] = value
+			offset += 1
+	return offset
+
+def _decode_leb128_array(signed: bool, view: memoryview, offset: int, end: int, count: int) -> tuple[list[int], int]:
+	"""Decode count SLEB128 or ULEB128 values stored back to back at offset, returns (values, new offset)"""
+	if numpy is not None and count:
+		data = numpy.frombuffer(view, dtype=numpy.uint8, count=min(end - offset, 10 * count), offset=offset)
+		ends = numpy.flatnonzero(data < 0x80)[:count]
+		if len(ends) < count:
+			raise Caps.CapsError("Truncated %s" % ("SLEB128" if signed else "ULEB128"))
+		starts = numpy.empty(count, dtype=numpy.int64)
+		starts[0] = 0
+		starts[1:] = ends[:-1] + 1
+		lengths = ends - starts + 1
+		# 10 byte values can overflow 64 bits, those runs are left to the exact pure python path
+		if lengths.max() < 10:
+			total = int(ends[-1]) + 1
+			shifts = (numpy.arange(total) - numpy.repeat(starts, lengths)) * 7
+			result = numpy.bitwise_or.reduceat((data[:total] & 0x7F).astype(numpy.uint64) << shifts.astype(numpy.uint64), starts)
+			if signed:
+				negative = (data[ends] & 0x40) != 0
+				result[negative] |= ~numpy.uint64(0) << (lengths[negative] * 7).astype(numpy.uint64)
+				result = result.view(numpy.int64)
+			return result.tolist(), offset + total
+
+	values = []
+	append = values.append
+	for _ in range(count):
+		result = 0
+		shift = 0
+		while True:
+			if offset >= end:
+				raise Caps.CapsError("Truncated %s" % ("SLEB128" if signed else "ULEB128"))
+			byte = view[offset]
+			offset += 1
+			result |= (byte & 0x7F) << shift
+			shift += 7
+			if byte < 0x80:
+				break
+			if shift >= 64 and not signed:
+				raise Caps.CapsError("ULEB128 too large")
+		if signed and byte & 0x40:
+			result |= -(1 << shift)
+		append(result)
+	return values, offset
+
+# Type codes that can be inferred from the python type alone, ints are ranged in Caps.Value._infer
+Caps.Value._INFER = {
+	type(None): Caps.Value.TYPE_VOID,
+	bool: Caps.Value.TYPE_UINT32,
+	float: Caps.Value.TYPE_FLOAT, # Or double
+	str: Caps.Value.TYPE_STRING,
+	bytes: Caps.Value.TYPE_BINARY,
+	bytearray: Caps.Value.TYPE_BINARY,
+	memoryview: Caps.Value.TYPE_BINARY,
+	Caps: Caps.Value.TYPE_OBJECT,
+}
+
+# Codec table: type code, size, write, read, read with copyBinary, skip
+# Objects have no reader, Caps.__read_members parses them itself because it tracks the nesting depth
+_CODECS = (
+	(Caps.Value.TYPE_VOID, Caps._size_void, Caps._write_void, Caps._read_void, Caps._read_void, Caps._skip_void),
+	(Caps.Value.TYPE_INT32, Caps._sleb128_size, Caps._write_sleb128, Caps._decode_sleb128, Caps._decode_sleb128, Caps._skip_leb128),
+	(Caps.Value.TYPE_UINT32, Caps._uleb128_size, Caps._write_uleb128, Caps._decode_uleb128, Caps._decode_uleb128, Caps._skip_leb128),
+	(Caps.Value.TYPE_FLOAT, Caps._size_float, Caps._write_float, Caps._read_float, Caps._read_float, Caps._skip_float),
+	(Caps.Value.TYPE_INT64, Caps._sleb128_size, Caps._write_sleb128, Caps._decode_sleb128, Caps._decode_sleb128, Caps._skip_leb128),
+	(Caps.Value.TYPE_UINT64, Caps._uleb128_size, Caps._write_uleb128, Caps._decode_uleb128, Caps._decode_uleb128, Caps._skip_leb128),
+	(Caps.Value.TYPE_DOUBLE, Caps._size_double, Caps._write_double, Caps._read_double, Caps._read_double, Caps._skip_double),
+	(Caps.Value.TYPE_STRING, Caps._size_string, Caps._write_string, Caps._read_string, Caps._read_string, Caps._skip_sized),
+	(Caps.Value.TYPE_BINARY, Caps._size_binary, Caps._write_binary, Caps._read_binary, Caps._read_binary_copy, Caps._skip_sized),
+	(Caps.Value.TYPE_OBJECT, Caps._size_object, Caps._write_object, None, None, Caps._skip_object),
+)
+Caps._SIZERS = {codec[0]: codec[1] for codec in _CODECS}
+Caps._WRITERS = {codec[0]: codec[2] for codec in _CODECS}
+Caps._READERS = {codec[0]: codec[3] for codec in _CODECS if codec[3] is not None}
+Caps._READERS_COPY = {codec[0]: codec[4] for codec in _CODECS if codec[4] is not None}
+Caps._SKIPPERS = {codec[0]: codec[5] for codec in _CODECS}
+
+class CapsStreamDecoder:
+	"""Incremental decoder that turns a stream of received bytes into :type:`Caps` frames
+
+	Frames are length-prefixed with their 4 byte big-endian size, so a frame is decoded as soon as that many bytes are available.
+	Received bytes are kept in one growable buffer with a read offset, which only gets compacted once enough of it has been consumed.
+
+	:param bool lazy: Decode frames with :func:`Caps.fromBytesLazy` instead of :func:`Caps.fromBytes`
+	:param bool copyBinary: Materialize ``TYPE_BINARY`` members as :type:`bytes` instead of :type:`memoryview` slices of the frame
+	:param Optional[CapsLimits] limits: Limits for untrusted input, defaults to :attr:`Caps.DEFAULT_LIMITS`.
+		The frame size is checked as soon as its size prefix arrives, so an oversized frame is never buffered.
+		After a :type:`Caps.LimitExceededError` the stream can't be trusted anymore, call :func:`CapsStreamDecoder.reset` or reconnect.
+	"""
+
+	COMPACT_THRESHOLD = 64 * 1024
+	"""Amount of consumed bytes at the start of the buffer before it gets compacted"""
+
+	def __init__(self, lazy: bool = False, copyBinary: bool = False, limits: CapsLimits = None):
+		self.__buffer = bytearray()
+		self.__offset = 0
+		self.__position = 0
+		self.__parse = Caps.fromBytesLazy if lazy else Caps.fromBytes
+		self.__copyBinary = copyBinary
+		self.__limits = Caps.DEFAULT_LIMITS if limits is None else limits
+
+	def feed(self, chunk: bytes) -> list[Caps]:
+		"""Add received bytes to the decoder
+
+		:param bytes chunk: The bytes that were just received
+		:returns: Every frame that got completed by this chunk, in order
+		:raises Caps.CapsError: When a frame is corrupt, its ``frames`` attribute has the frames of this chunk in front of the corrupt one.
+			Those are consumed, so they're never returned again, but the corrupt frame is kept and raises again on the next feed
+		"""
+		frames = []
+		if self.__offset == len(self.__buffer) and isinstance(chunk, bytes):
+			# Nothing buffered, decode straight from the chunk and only keep its incomplete tail
+			self.__buffer.clear()
+			self.__offset = 0
+			data = chunk
+		else:
+			self.__buffer += chunk
+			data = self.__buffer
+		self.__position = self.__offset
+		try:
+			self.__decode(data, self.__offset, len(data), frames)
+		except Caps.CapsError as e:
+			e.frames = frames
+			raise
+		finally:
+			# Also after an error, so the frames in front of it aren't decoded again
+			if data is chunk:
+				self.__buffer += memoryview(chunk)[self.__position:]
+			elif self.__position == len(self.__buffer):
+				self.__buffer.clear()
+				self.__offset = 0
+			elif self.__position >= CapsStreamDecoder.COMPACT_THRESHOLD and self.__position * 2 >= len(self.__buffer):
+				del self.__buffer[:self.__position]
+				self.__offset = 0
+			else:
+				self.__offset = self.__position
+		return frames
+
+	def __decode(self, data: bytes, offset: int, end: int, frames: list[Caps]) -> None:
+		"""Decode all complete frames in data between offset and end, ``__position`` follows the offset of the first frame that isn't decoded"""
+		copyFrame = not isinstance(data, bytes)
+		limits = self.__limits
+		while end - offset >= 4:
+			size = _UINT32_BE.unpack_from(data, offset)[0]
+			if size < 5:
+				raise Caps.CapsError("Size mismatch: expected at least 5, got %d" % (size))
+			if size > limits.maxFrameSize:
+				raise Caps.LimitExceededError("Frame too large: %d, limit is %d" % (size, limits.maxFrameSize))
+			if end - offset < size:
+				break
+			if copyFrame:
+				# The buffer gets reused, so the frame must not keep views into it
+				frame = bytes(memoryview(data)[offset:offset + size])
+			else:
+				frame = memoryview(data)[offset:offset + size]
+			caps, _ = self.__parse(frame, self.__copyBinary, limits)
+			frames.append(caps)
+			offset += size
+			self.__position = offset
+
+	def pending(self) -> int:
+		"""Return the number of buffered bytes that are not part of a complete frame yet"""
+		return len(self.__buffer) - self.__offset
+
+	def reset(self) -> None:
+		"""Drop all buffered bytes, for example after a reconnect or a corrupt frame"""
+		self.__buffer.clear()
+		self.__offset = 0
+
+class CapsTemplate:
+	"""Pre-encoded message shape, for sending the same command many times with only a few members changing
+
+	The header, descriptor table and all constant members of the example are encoded once.
+	:func:`CapsTemplate.render` then only encodes the varying members and patches the 4 byte size header.
+
+	:param Caps example: An example message, its member types are kept for every render
+	:param list[int] varying: Indexes of the top-level members that change between renders
+	"""
+
+	# Per-type value conversion, indexed by type code. This gets filled in below the class
+	_COERCERS: dict = None
+
+	def __init__(self, example: Caps, varying: list[int]):
+		data = memoryview(example.serialize())
+		count, offset = Caps._decode_uleb128(data, 5)
+		types = data[offset:offset + count]
+		offset += count
+
+		varying = sorted(set(varying))
+		for index in varying:
+			if index < 0 or index >= count:
+				raise IndexError("Index out of range")
+
+		# Split the member data into the constant segments around the varying members
+		segments = []
+		start = 0
+		for index in range(count):
+			end = Caps._SKIPPERS[types[index]](data, offset, len(data))
+			if index in varying:
+				segments.append(bytes(data[start:offset]))
+				start = end
+			offset = end
+		segments.append(bytes(data[start:]))
+
+		self.__segments = segments
+		self.__constSize = sum(len(segment) for segment in segments)
+		self.__sizers = [Caps._SIZERS[types[index]] for index in varying]
+		self.__writers = [Caps._WRITERS[types[index]] for index in varying]
+		self.__coercers = [CapsTemplate._COERCERS[types[index]] for index in varying]
+
+	def size(self) -> int:
+		"""Return the number of varying members :func:`CapsTemplate.render` expects"""
+		return len(self.__writers)
+
+	def render(self, *values: Any) -> bytes:
+		"""Encode a message with the given values for the varying members, in order
+
+		The values are converted like the ``Caps.write*`` function of their member type does.
+		A value that can't be converted, or is out of range for its integer type, raises :type:`Caps.IncorrectTypeException`.
+
+		:returns: The serialized message, same as :func:`Caps.serialize` would give
+		"""
+		values = self.__coerce(values)
+		size = self.__size(values)
+		buffer = bytearray(size)
+		self.__write(buffer, 0, size, values)
+		return bytes(buffer)
+
+	def renderInto(self, buffer: bytearray, offset: int, *values: Any) -> int:
+		"""Encode a message into an existing buffer, like :func:`Caps.serializeInto`
+
+		:param bytearray buffer: The buffer to write into, a :type:`bytearray` gets extended when it's too small
+		:param int offset: The position in the buffer to start writing at
+		:returns: The number of bytes written
+		"""
+		values = self.__coerce(values)
+		size = self.__size(values)
+		Caps._reserve(buffer, offset + size)
+		self.__write(buffer, offset, size, values)
+		return size
+
+	def __coerce(self, values: tuple) -> list:
+		"""Convert the varying values to their member types, the writers expect exact types"""
+		if len(values) != len(self.__writers):
+			raise Caps.CapsError("Expected %d values, got %d" % (len(self.__writers), len(values)))
+		try:
+			return [coerce(value) for coerce, value in zip(self.__coercers, values)]
+		except (TypeError, ValueError) as e:
+			raise Caps.IncorrectTypeException("Invalid template value: %s" % (e)) from None
+
+	def __size(self, values: list) -> int:
+		"""Return the encoded size of a message with the given varying values"""
+		size = self.__constSize
+		for sizer, value in zip(self.__sizers, values):
+			size += sizer(value)
+		return size
+
+	def __write(self, buffer: bytearray, offset: int, size: int, values: tuple) -> None:
+		"""Copy the constant segments and encode the varying values in between them"""
+		segments = self.__segments
+		position = offset
+		for segment, writer, value in zip(segments, self.__writers, values):
+			buffer[position:position + len(segment)] = segment
+			position = writer(buffer, position + len(segment), value)
+		buffer[position:position + len(segments[-1])] = segments[-1]
+		_UINT32_BE.pack_into(buffer, offset, size)
+
+def _coerce_integer(low: int, high: int) -> Callable:
+	"""Return a function that converts a value to int like :func:`Caps.writeInt32` and checks it's in range"""
+	def coerce(value: Any) -> int:
+		value = int(value)
+		if not low <= value < high:
+			raise ValueError("%d is out of range" % (value))
+		return value
+	return coerce
+
+def _coerce_binary(value: Any) -> Any:
+	memoryview(value)
+	return value
+
+def _coerce_object(value: Any) -> Caps:
+	if not isinstance(value, Caps):
+		raise TypeError("expected Caps, got %s" % (type(value).__name__))
+	return value
+
+def _coerce_void(value: Any) -> None:
+	if value is not None:
+		raise TypeError("expected None, got %s" % (type(value).__name__))
+
+# Per-type value conversion of CapsTemplate, like the matching Caps.write* function
+CapsTemplate._COERCERS = {
+	Caps.Value.TYPE_VOID: _coerce_void,
+	Caps.Value.TYPE_INT32: _coerce_integer(-2**31, 2**31),
+	Caps.Value.TYPE_UINT32: _coerce_integer(0, 2**32),
+	Caps.Value.TYPE_FLOAT: float,
+	Caps.Value.TYPE_INT64: _coerce_integer(-2**63, 2**63),
+	Caps.Value.TYPE_UINT64: _coerce_integer(0, 2**64),
+	Caps.Value.TYPE_DOUBLE: float,
+	Caps.Value.TYPE_STRING: str,
+	Caps.Value.TYPE_BINARY: _coerce_binary,
+	Caps.Value.TYPE_OBJECT: _coerce_object,
+}
+
 # Example usage
 if __name__ == "__main__":
 	# Create a Caps object
@@ -0,0 +1,206 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+from typing import Callable
+from .utils import LogUtil
+from .libcaps import Caps
+from .cxr_socket_protocol import CXRSocketProtocol, PacketTypeIds
+from .extend.listeners import ArtcListener, AudioStreamListener, CustomCmdListener
+
+class OrderedExecutor:
+	"""Thread pool that runs the tasks of one key in submission order, and tasks of different keys concurrently
+
+	Every key has its own bounded queue, so a slow key only delays and drops its own tasks.
+	A worker runs one task of a key and then requeues the key behind the others, so a busy key can't hold on to a worker.
+
+	:param int maxWorkers: Number of worker threads
+	:param int maxQueued: Number of tasks that can wait per key, newer tasks of a full key are dropped
+	"""
+
+	def __init__(self, maxWorkers: int = 4, maxQueued: int = 1024):
+		self.maxQueued = maxQueued
+		"""Number of tasks that can wait per key"""
+		self.dropped = 0
+		"""Number of tasks that were dropped because their key was full"""
+		self.__pool = ThreadPoolExecutor(maxWorkers, thread_name_prefix='cxr-listener')
+		self.__condition = Condition()
+		self.__queues = {}
+
+	def submit(self, key: Any, fn: Callable, *args) -> bool:
+		"""Queue fn(*args) behind the other tasks of key, never blocks
+
+		:returns: False when the queue of key is full and the task was dropped
+		"""
+		with self.__condition:
+			queue = self.__queues.get(key)
+			if queue is None:
+				self.__queues[key] = deque(((fn, args),))
+				self.__pool.submit(self.__run, key)
+				return True
+			if len(queue) >= self.maxQueued:
+				self.dropped += 1
+				return False
+			queue.append((fn, args))
+			return True
+
+	def __run(self, key: Any) -> None:
+		queue = self.__queues[key]
+		fn, args = queue[0]
+		try:
+			fn(*args)
+		except Exception as e:
+			# A broken listener must not stop the others
+			LogUtil.e("OrderedExecutor", e)
+		with self.__condition:
+			queue.popleft()
+			if queue:
+				self.__pool.submit(self.__run, key)
+			else:
+				del self.__queues[key]
+				if not self.__queues:
+					self.__condition.notify_all()
+
+	def pending(self) -> int:
+		"""Return the number of tasks that are queued or running"""
+		with self.__condition:
+			return sum(len(queue) for queue in self.__queues.values())
+
+	def shutdown(self, wait: bool = True) -> None:
+		"""Stop the workers, with wait the queued tasks are finished first"""
+		if wait:
+			# Tasks requeue their key on the pool, so wait until every queue is empty before the pool stops accepting
+			with self.__condition:
+				while self.__queues:
+					self.__condition.wait()
+		self.__pool.shutdown(wait)
+
+class CXRPacketRouter(CXRSocketProtocol.Callback):
+	"""Callback for :class:`CXRSocketProtocol` that routes packets to handlers, which run on an :class:`OrderedExecutor`
+
+	Routes are kept in a table keyed by ``(packet type, notify name)``, so finding the handlers of a packet is one lookup.
+	A handler gets the arguments of the :class:`CXRSocketProtocol.Callback` method for its packet type,
+	for example ``handler(name, caps)`` for ``NOTIFY`` and ``handler(data, codecType, sequence)`` for ``AI_DATA``.
+	Packets without their own method, or with a layout their method didn't accept, go to :attr:`CXRPacketRouter.RECEIVED` routes
+	with the arguments of :func:`Callback.onReceived`, and :attr:`CXRPacketRouter.DISCONNECT` routes get none.
+
+	Handlers never run on the reader, the handlers of one key run one at a time in packet order.
+	The key defaults to the handler itself, the handlers of a listener added with :func:`CXRPacketRouter.addListener` share the listener as key.
+
+	Example::
+
+		router = CXRPacketRouter()
+		router.route(PacketTypeIds.NOTIFY, lambda name, caps: print(caps), name='battery')
+		router.addListener(myAudioStreamListener)
+		await protocol.connectTcp('127.0.0.1', 8849, router)
+
+	:param Optional[OrderedExecutor] executor: The executor handlers run on, defaults to a new :class:`OrderedExecutor`
+	"""
+
+	DISCONNECT = -1
+	"""Packet type to route :func:`Callback.onDisconnect` with"""
+	RECEIVED = -2
+	"""Packet type to route :func:`Callback.onReceived` with, the name of these routes is the packet type name it passes"""
+
+	# Listener interface -> (packet type, function(listener) that returns the handler) for every packet it listens to
+	# The notify names of the other listeners aren't known yet, route those with CXRPacketRouter.route
+	_LISTENER_ROUTES = {
+		AudioStreamListener: (
+			(PacketTypeIds.AI_START, lambda listener: lambda streamType, name, caps: listener.onStartAudioStream(streamType, name)),
+			(PacketTypeIds.AI_DATA, lambda listener: listener.onAudioStream),
+		),
+		ArtcListener: (
+			(PacketTypeIds.ARTC_FRAME, lambda listener: listener.onArtsFrame),
+		),
+		CustomCmdListener: (
+			(PacketTypeIds.NOTIFY, lambda listener: listener.onCustomCmd),
+		),
+	}
+
+	def __init__(self, executor: OrderedExecutor = None):
+		self.executor = executor or OrderedExecutor()
+		"""The executor the handlers run on"""
+		self.__lock = Lock()
+		self.__routes = {}
+
+	def route(self, packetType: int, handler: Callable, name: str = None, key: Any = None) -> None:
+		"""Add a handler for a packet type
+
+		:param int packetType: The :class:`PacketTypeIds` to handle, or :attr:`CXRPacketRouter.DISCONNECT` or :attr:`CXRPacketRouter.RECEIVED`
+		:param Callable handler: Function that gets the arguments of the matching :class:`CXRSocketProtocol.Callback` method
+		:param Optional[str] name: Only handle ``NOTIFY`` packets with this name, or ``RECEIVED`` packets with this type name.
+			Routes with a name take precedence over the route without one
+		:param Any key: Handlers with the same key run one at a time in packet order, defaults to the handler
+		"""
+		with self.__lock:
+			# Routes are replaced instead of changed, so the reader can look them up without the lock
+			routes = self.__routes.get((packetType, name), ())
+			self.__routes[(packetType, name)] = routes + ((handler if key is None else key, handler),)
+
+	def unroute(self, packetType: int, handler: Callable, name: str = None) -> None:
+		"""Remove a handler added with :func:`CXRPacketRouter.route`"""
+		self.__remove(lambda route: route[1] == handler, (packetType, name))
+
+	def addListener(self, listener: Any) -> None:
+		"""Route the packets of a listener from :mod:`pyrokid_cxr_clientm.extend.listeners`
+
+		Supported are :class:`AudioStreamListener`, :class:`ArtcListener` and :class:`CustomCmdListener` (which gets all notifies without a named route).
+		The methods of one listener run one at a time in packet order.
+		"""
+		found = False
+		for interface, routes in CXRPacketRouter._LISTENER_ROUTES.items():
+			if isinstance(listener, interface):
+				found = True
+				for packetType, handler in routes:
+					self.route(packetType, handler(listener), key=listener)
+		if not found:
+			raise TypeError("No routes for %s, use CXRPacketRouter.route" % (type(listener).__name__))
+
+	def removeListener(self, listener: Any) -> None:
+		"""Remove the routes of a listener added with :func:`CXRPacketRouter.addListener`"""
+		self.__remove(lambda route: route[0] is listener)
+
+	def __remove(self, match: Callable, only: tuple = None) -> None:
+		with self.__lock:
+			for routeKey, routes in list(self.__routes.items()):
+				if only is not None and routeKey != only:
+					continue
+				routes = tuple(route for route in routes if not match(route))
+				if routes:
+					self.__routes[routeKey] = routes
+				else:
+					del self.__routes[routeKey]
+
+	def handlers(self, packetType: int, name: str = None) -> tuple:
+		"""Return the ``(key, handler)`` routes a packet goes to"""
+		routes = self.__routes.get((packetType, name))
+		if routes is None and name is not None:
+			routes = self.__routes.get((packetType, None))
+		return routes or ()
+
+	def __publish(self, packetType: int, name: str, args: tuple) -> None:
+		for key, handler in self.handlers(packetType, name):
+			if not self.executor.submit(key, handler, *args):
+				LogUtil.w("CXRPacketRouter", "Listener queue full, dropped packet 0x%04x for %s", packetType, key)
+
+	def onResponse(self, param1Int: int, param1Caps: Caps) -> None:
+		self.__publish(PacketTypeIds.RESPONSE, None, (param1Int, param1Caps))
+
+	def onNotify(self, param1String: str, param1Caps: Caps) -> None:
+		self.__publish(PacketTypeIds.NOTIFY, param1String, (param1String, param1Caps))
+
+	def onReceived(self, param1String: str, param1Caps: Caps, param1ArrayOfbyte: bytes) -> None:
+		# Not by packet type, a malformed packet of a known type would reach handlers that expect other arguments
+		self.__publish(CXRPacketRouter.RECEIVED, param1String, (param1String, param1Caps, param1ArrayOfbyte))
+
+	def onStartAudioStream(self, param1Int: int, param1String: str, param1Caps: Caps) -> None:
+		self.__publish(PacketTypeIds.AI_START, None, (param1Int, param1String, param1Caps))
+
+	def onAudioStream(self, param1ArrayOfbyte: bytes, param1Int1: int, param1Int2: int) -> None:
+		self.__publish(PacketTypeIds.AI_DATA, None, (param1ArrayOfbyte, param1Int1, param1Int2))
+
+	def onARTCFrame(self, param1ArrayOfbyte: bytes) -> None:
+		self.__publish(PacketTypeIds.ARTC_FRAME, None, (param1ArrayOfbyte,))
+
+	def onDisconnect(self) -> None:
+		self.__publish(CXRPacketRouter.DISCONNECT, None, ())
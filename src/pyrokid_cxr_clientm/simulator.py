@@ -0,0 +1,382 @@
+"""
+Local stand-in for the Rokid Glasses, for load testing without real hardware
+
+The simulator serves the :class:`CXRSocketProtocol` packets over TCP or a Unix socket, and the HTTP endpoints
+:class:`FileController` uses from a local directory, which plays the role of the glasses' ``/``.
+The member layouts of the simulated packets follow the assumptions of :class:`CXRSocketProtocol`.
+
+Usage::
+
+	python -m pyrokid_cxr_clientm.simulator --root sim/ --tcp 127.0.0.1:8849 --http 127.0.0.1:8848 --audio-rate 50 --artc-rate 30 --latency 5:20
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.utils import formatdate
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import parse_qsl
+import argparse, asyncio, json, os, random, shutil, time
+from .libcaps import Caps, CapsStreamDecoder
+from .cxr_socket_protocol import PacketTypeIds
+from .utils import LogUtil
+
+@dataclass
+class Distribution:
+	"""Uniform distribution between ``low`` and ``high``, parsed from ``"n"`` or ``"low:high"``"""
+	low: float = 0
+	high: float = 0
+
+	@staticmethod
+	def parse(value: str) -> Distribution:
+		low, _, high = str(value).partition(':')
+		return Distribution(float(low), float(high or low))
+
+	def sample(self) -> float:
+		return self.low if self.low == self.high else random.uniform(self.low, self.high)
+
+@dataclass
+class SimulatorConfig:
+	"""Behaviour of a :class:`GlassesSimulator`, rates are in packets per second and 0 turns a stream off"""
+	latency: Distribution = field(default_factory=Distribution)
+	"""Milliseconds added before every packet the simulator sends, packets still go out in order"""
+	notifyRate: float = 1.0
+	"""Rate of ``NOTIFY`` packets"""
+	notifyName: str = 'battery'
+	"""Name in the ``NOTIFY`` packets"""
+	audioRate: float = 0.0
+	"""Rate of ``AI_DATA`` audio packets"""
+	audioSize: Distribution = field(default_factory=lambda: Distribution(640, 640))
+	"""Bytes of audio per packet"""
+	artcRate: float = 0.0
+	"""Rate of ``ARTC_FRAME`` packets"""
+	artcSize: Distribution = field(default_factory=lambda: Distribution(20000, 60000))
+	"""Bytes per ARTC frame"""
+
+class GlassesSimulator:
+	"""Simulated glasses, serving any number of clients
+
+	- ``AUTH_REQUEST`` is answered with ``[AUTH_RESPONSE, 0]``
+	- ``[REQUEST, id, ...]`` is answered with ``[RESPONSE, id, ...]``, built by :attr:`GlassesSimulator.responder`
+	- ``NOTIFY``, audio and ARTC packets are streamed at the rates of the :class:`SimulatorConfig`
+
+	:param Optional[SimulatorConfig] config: The behaviour of the simulator
+	:param Optional[str] root: Directory served as the glasses' ``/`` by :func:`GlassesSimulator.serveHttp`
+	"""
+
+	def __init__(self, config: SimulatorConfig = None, root: str = None):
+		self.config = config or SimulatorConfig()
+		self.root = os.path.realpath(root or os.getcwd())
+		self.responder = GlassesSimulator.echo
+		"""Function that turns the members of a request into the members of its response, as function(request: Caps) -> Caps"""
+		self.received = 0
+		"""Number of packets received from all clients"""
+		self.sent = 0
+		"""Number of packets sent to all clients"""
+		self.__servers = []
+		self.__sessions = set()
+		self.__payload = os.urandom(256 * 1024)
+
+	@staticmethod
+	def echo(request: Caps) -> Caps:
+		"""Default :attr:`GlassesSimulator.responder`, answers with the members of the request after its id"""
+		response = Caps()
+		for index in range(2, len(request)):
+			response.write(request.at(index))
+		return response
+
+	async def serveTcp(self, host: str = '127.0.0.1', port: int = 0) -> tuple[str, int]:
+		"""Start serving the protocol on a TCP port, returns the address it listens on"""
+		server = await asyncio.start_server(self.__session, host, port)
+		self.__servers.append(server)
+		return server.sockets[0].getsockname()[:2]
+
+	async def serveUnix(self, path: str) -> None:
+		"""Start serving the protocol on a Unix socket"""
+		server = await asyncio.start_unix_server(self.__session, path)
+		self.__servers.append(server)
+
+	def serveHttp(self, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+		"""Start serving the :class:`FileController` endpoints from :attr:`GlassesSimulator.root` in a background thread
+
+		:returns: The server, its ``server_address`` is the address it listens on. Call ``shutdown()`` to stop it
+		"""
+		simulator = self
+		class Handler(_FileServerHandler):
+			root = simulator.root
+		server = ThreadingHTTPServer((host, port), Handler)
+		server.daemon_threads = True
+		Thread(target=server.serve_forever, daemon=True).start()
+		return server
+
+	async def close(self) -> None:
+		"""Stop serving and disconnect all clients"""
+		for server in self.__servers:
+			server.close()
+		for task in list(self.__sessions):
+			task.cancel()
+		for server in self.__servers:
+			await server.wait_closed()
+		self.__servers = []
+
+	async def __session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		task = asyncio.current_task()
+		self.__sessions.add(task)
+		outbox = asyncio.Queue()
+		helpers = [
+			asyncio.ensure_future(self.__sender(writer, outbox)),
+			asyncio.ensure_future(self.__stream(outbox, self.config.notifyRate, self.__notify)),
+			asyncio.ensure_future(self.__stream(outbox, self.config.audioRate, self.__audio)),
+			asyncio.ensure_future(self.__stream(outbox, self.config.artcRate, self.__artc)),
+		]
+		try:
+			decoder = CapsStreamDecoder()
+			while True:
+				chunk = await reader.read(64 * 1024)
+				if not chunk:
+					break
+				for caps in decoder.feed(chunk):
+					self.received += 1
+					response = self.__respond(caps)
+					if response is not None:
+						self.__enqueue(outbox, response)
+		except (ConnectionError, Caps.CapsError) as e:
+			LogUtil.d("GlassesSimulator", "Client dropped: %s", e)
+		except asyncio.CancelledError:
+			pass
+		finally:
+			for helper in helpers:
+				helper.cancel()
+			writer.close()
+			self.__sessions.discard(task)
+
+	def __respond(self, caps: Caps) -> Caps:
+		"""Return the response to a received packet, or None"""
+		if not len(caps) or caps.at(0).type() != Caps.Value.TYPE_UINT32:
+			return None
+		packetType = caps.at(0).getInt()
+		if packetType == PacketTypeIds.AUTH_REQUEST:
+			return Caps().writeUInt32(PacketTypeIds.AUTH_RESPONSE).writeUInt32(0)
+		if packetType == PacketTypeIds.REQUEST and len(caps) >= 2:
+			response = Caps().writeUInt32(PacketTypeIds.RESPONSE).writeUInt32(caps.at(1).getInt())
+			members = self.responder(caps)
+			for index in range(len(members)):
+				response.write(members.at(index))
+			return response
+		return None
+
+	def __enqueue(self, outbox: asyncio.Queue, caps: Caps) -> None:
+		outbox.put_nowait((time.monotonic() + self.config.latency.sample() / 1000, caps.serialize()))
+
+	async def __sender(self, writer: asyncio.StreamWriter, outbox: asyncio.Queue) -> None:
+		# Packets are released in order, each no earlier than its own latency
+		while True:
+			release, data = await outbox.get()
+			delay = release - time.monotonic()
+			if delay > 0:
+				await asyncio.sleep(delay)
+			writer.write(data)
+			self.sent += 1
+			if outbox.empty():
+				await writer.drain()
+
+	async def __stream(self, outbox: asyncio.Queue, rate: float, packet) -> None:
+		if rate <= 0:
+			return
+		interval = 1 / rate
+		sequence = 0
+		deadline = time.monotonic()
+		while True:
+			self.__enqueue(outbox, packet(sequence))
+			sequence += 1
+			deadline += interval
+			await asyncio.sleep(max(0, deadline - time.monotonic()))
+
+	def __data(self, size: Distribution) -> bytes:
+		length = min(int(size.sample()), len(self.__payload))
+		start = random.randrange(len(self.__payload) - length + 1)
+		return self.__payload[start:start + length]
+
+	def __notify(self, sequence: int) -> Caps:
+		return Caps().writeUInt32(PacketTypeIds.NOTIFY).writeString(self.config.notifyName).writeUInt32(100 - sequence % 101)
+
+	def __audio(self, sequence: int) -> Caps:
+		return Caps().writeUInt32(PacketTypeIds.AI_DATA).writeBinary(self.__data(self.config.audioSize)).writeUInt32(1).writeUInt32(sequence & 0xFFFFFFFF)
+
+	def __artc(self, sequence: int) -> Caps:
+		return Caps().writeUInt32(PacketTypeIds.ARTC_FRAME).writeBinary(self.__data(self.config.artcSize))
+
+class _FileServerHandler(BaseHTTPRequestHandler):
+	"""The ``/server/*`` endpoints of the glasses, see :class:`RetrofitService`"""
+	root: str = None
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format: str, *args) -> None:
+		LogUtil.d("GlassesSimulator", format, *args)
+
+	def do_POST(self) -> None:
+		handler = {
+			'/server/openFileList': self.__openFileList,
+			'/server/downloadFile': self.__downloadFile,
+			'/server/reportDownload': self.__reportDownload,
+			'/server/deleteFile': self.__deleteFile,
+			'/server/upload': self.__upload,
+		}.get(self.path.split('?')[0])
+		if handler is None:
+			self.__json({'errorCode': 404, 'errorMsg': 'Not found', 'isSuccess': False}, 404)
+			return
+		try:
+			handler(self.__parts())
+		except (OSError, ValueError) as e:
+			self.__json({'errorCode': 500, 'errorMsg': str(e), 'isSuccess': False}, 500)
+
+	def __parts(self) -> dict:
+		"""Parse the form body to name -> (filename, bytes), the client sends urlencoded fields and multipart files"""
+		body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+		contentType = self.headers.get('Content-Type', '')
+		if contentType.startswith('application/x-www-form-urlencoded'):
+			return {name: (None, value.encode('utf-8')) for name, value in parse_qsl(body.decode('utf-8'), keep_blank_values=True)}
+		if not contentType.startswith('multipart/'):
+			return {}
+		message = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + contentType.encode('latin-1') + b'\r\n\r\n' + body)
+		parts = {}
+		for part in message.iter_parts():
+			parts[part.get_param('name', header='content-disposition')] = (part.get_filename(), part.get_payload(decode=True))
+		return parts
+
+	def __local(self, devicePath: str) -> str:
+		"""Map a path on the glasses to the simulator root, refusing paths outside of it"""
+		path = os.path.realpath(os.path.join(self.root, devicePath.lstrip('/')))
+		if path != self.root and not path.startswith(self.root + os.sep):
+			raise ValueError("Path outside of the root: %s" % (devicePath))
+		return path
+
+	def __filePath(self, parts: dict) -> str:
+		return parts.get('filePath', (None, b''))[1].decode('utf-8')
+
+	def __json(self, value: dict, status: int = 200) -> None:
+		body = json.dumps(value).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def __openFileList(self, parts: dict) -> None:
+		devicePath = self.__filePath(parts).rstrip('/')
+		directory = self.__local(devicePath)
+		files = []
+		if os.path.isdir(directory):
+			for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+				stat = entry.stat()
+				files.append({
+					'absoluteFilePath': devicePath + '/' + entry.name,
+					'createDate': int(stat.st_mtime * 1000),
+					'fileName': entry.name,
+					'fileSize': stat.st_size,
+					'modifiedDate': int(stat.st_mtime * 1000),
+					'webFilePath': devicePath + '/' + entry.name,
+					'isDir': entry.is_dir(),
+				})
+		self.__json({'errorCode': 200, 'errorMsg': '', 'isSuccess': True, 'data': files})
+
+	def __downloadFile(self, parts: dict) -> None:
+		path = self.__local(self.__filePath(parts))
+		if not os.path.isfile(path):
+			self.__json({'errorCode': 404, 'errorMsg': 'File not found', 'isSuccess': False}, 404)
+			return
+		with open(path, 'rb') as file:
+			stat = os.fstat(file.fileno())
+			size = stat.st_size
+			lastModified = formatdate(int(stat.st_mtime), usegmt=True)
+			# Only the open ended "bytes=start-" form is supported, which is what a resumed download sends
+			start = 0
+			requested = self.headers.get('Range', '')
+			ifRange = self.headers.get('If-Range')
+			if ifRange is not None and ifRange != lastModified:
+				# The file changed since the part was downloaded, send all of it
+				requested = ''
+			if requested.startswith('bytes=') and requested.endswith('-') and requested[6:-1].isdigit():
+				start = int(requested[6:-1])
+				if start >= size:
+					self.send_response(416)
+					self.send_header('Content-Range', 'bytes */%d' % (size))
+					self.send_header('Content-Length', '0')
+					self.end_headers()
+					return
+			self.send_response(206 if start else 200)
+			self.send_header('Content-Type', 'application/octet-stream')
+			self.send_header('Content-Length', str(size - start))
+			self.send_header('Last-Modified', lastModified)
+			if start:
+				self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, size - 1, size))
+			self.end_headers()
+			file.seek(start)
+			shutil.copyfileobj(file, self.wfile, 256 * 1024)
+
+	def __reportDownload(self, parts: dict) -> None:
+		self.__json({'errorCode': 200, 'errorMsg': '', 'isSuccess': True})
+
+	def __deleteFile(self, parts: dict) -> None:
+		path = self.__local(self.__filePath(parts))
+		if os.path.isfile(path):
+			os.unlink(path)
+		self.__json({'errorCode': 200, 'errorMsg': '', 'isSuccess': True})
+
+	def __upload(self, parts: dict) -> None:
+		directory = self.__local('upload')
+		os.makedirs(directory, exist_ok=True)
+		for filename, data in parts.values():
+			if filename:
+				with open(os.path.join(directory, os.path.basename(filename)), 'wb') as file:
+					file.write(data)
+		self.__json({'errorCode': 200, 'errorMsg': '', 'isSuccess': True})
+
+def _address(value: str) -> tuple[str, int]:
+	host, _, port = value.rpartition(':')
+	return host or '127.0.0.1', int(port)
+
+async def _main(args: argparse.Namespace) -> None:
+	config = SimulatorConfig(
+		latency=Distribution.parse(args.latency),
+		notifyRate=args.notify_rate,
+		audioRate=args.audio_rate,
+		audioSize=Distribution.parse(args.audio_size),
+		artcRate=args.artc_rate,
+		artcSize=Distribution.parse(args.artc_size),
+	)
+	simulator = GlassesSimulator(config, args.root)
+	if args.tcp:
+		print('Serving CXR on tcp://%s:%d' % tuple(await simulator.serveTcp(*_address(args.tcp))))
+	if args.unix:
+		await simulator.serveUnix(args.unix)
+		print('Serving CXR on unix:%s' % (args.unix))
+	if args.http:
+		server = simulator.serveHttp(*_address(args.http))
+		print('Serving files from %s on http://%s:%d' % ((simulator.root,) + server.server_address[:2]))
+	while True:
+		await asyncio.sleep(3600)
+
+def main(argv: list[str] = None) -> None:
+	parser = argparse.ArgumentParser(prog='python -m pyrokid_cxr_clientm.simulator', description='Simulate Rokid Glasses for load testing')
+	parser.add_argument('--root', default='.', help="directory served as the glasses' / (default: current directory)")
+	parser.add_argument('--tcp', help='host:port to serve the CXR protocol on')
+	parser.add_argument('--unix', help='Unix socket path to serve the CXR protocol on')
+	parser.add_argument('--http', help='host:port to serve the file endpoints on, the glasses use port 8848')
+	parser.add_argument('--latency', default='0', help='milliseconds added to every packet, as n or min:max (default: %(default)s)')
+	parser.add_argument('--notify-rate', type=float, default=1.0, help='notify packets per second (default: %(default)s)')
+	parser.add_argument('--audio-rate', type=float, default=0.0, help='audio packets per second (default: %(default)s)')
+	parser.add_argument('--audio-size', default='640', help='bytes per audio packet, as n or min:max (default: %(default)s)')
+	parser.add_argument('--artc-rate', type=float, default=0.0, help='ARTC frames per second (default: %(default)s)')
+	parser.add_argument('--artc-size', default='20000:60000', help='bytes per ARTC frame, as n or min:max (default: %(default)s)')
+	args = parser.parse_args(argv)
+	if not (args.tcp or args.unix or args.http):
+		parser.error('nothing to serve, give --tcp, --unix and/or --http')
+	try:
+		asyncio.run(_main(args))
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,15 @@
+import pytest
+from pyrokid_cxr_clientm.libcaps import Caps
+from pyrokid_cxr_clientm.caps_schema import CapsSchema
+
+@pytest.mark.parametrize('name', ['1st', 'class', 'self', '__p', '__p__'])
+def test_invalid_member_names(name):
+	with pytest.raises(ValueError):
+		CapsSchema('Message', [(name, Caps.Value.TYPE_UINT32)])
+
+def test_member_names_next_to_generated_code():
+	# Names of the generated code and _private names are fine as members
+	schema = CapsSchema('Message', [('name', Caps.Value.TYPE_STRING), ('record', Caps.Value.TYPE_UINT32), ('_p', Caps.Value.TYPE_UINT32)])
+	record = schema.record(name='battery', record=7, _p=1)
+	decoded, rest = schema.decode(schema.encode(record))
+	assert decoded == record and rest == b''
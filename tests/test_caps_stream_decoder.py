@@ -0,0 +1,39 @@
+import pytest
+from pyrokid_cxr_clientm.libcaps import Caps, CapsStreamDecoder
+
+def frame(number: int) -> bytes:
+	return Caps().writeUInt32(number).serialize()
+
+CORRUPT = b'\x00\x00\x00\x02'
+
+def numbers(frames: list) -> list:
+	return [caps.at(0).getInt() for caps in frames]
+
+def test_split_frames():
+	decoder = CapsStreamDecoder()
+	data = frame(1) + frame(2) + frame(3)
+	received = []
+	for index in range(0, len(data), 3):
+		received += decoder.feed(data[index:index + 3])
+	assert numbers(received) == [1, 2, 3]
+	assert decoder.pending() == 0
+
+@pytest.mark.parametrize('buffered', [False, True])
+def test_feed_after_corrupt_frame(buffered):
+	decoder = CapsStreamDecoder()
+	data = frame(1) + frame(2) + CORRUPT
+	received = []
+	if buffered:
+		# Start with a partial frame, so the chunk goes through the buffer
+		received += decoder.feed(frame(0)[:3])
+		data = frame(0)[3:] + data
+	with pytest.raises(Caps.CapsError) as error:
+		decoder.feed(data)
+	received += error.value.frames
+	assert numbers(received) == ([0, 1, 2] if buffered else [1, 2])
+	# The decoded frames are consumed, only the corrupt frame raises again
+	with pytest.raises(Caps.CapsError) as error:
+		decoder.feed(frame(3))
+	assert error.value.frames == []
+	decoder.reset()
+	assert numbers(decoder.feed(frame(4))) == [4]
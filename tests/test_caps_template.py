@@ -0,0 +1,28 @@
+import pytest
+from pyrokid_cxr_clientm.libcaps import Caps, CapsTemplate
+
+def example() -> Caps:
+	return Caps().writeUInt32(0x1003).writeUInt32(1).writeString('volume').writeInt32(5)
+
+def test_render_matches_serialize():
+	template = CapsTemplate(example(), [1, 3])
+	assert template.render(7, -3) == Caps().writeUInt32(0x1003).writeUInt32(7).writeString('volume').writeInt32(-3).serialize()
+
+def test_render_converts_like_write():
+	template = CapsTemplate(example(), [1, 3])
+	assert template.render('7', 2.0) == template.render(7, 2)
+
+@pytest.mark.parametrize('values', [('seven', 1), (-1, 1), (2**32, 1), (1, 2**31), (None, 1)])
+def test_render_wrong_values(values):
+	template = CapsTemplate(example(), [1, 3])
+	with pytest.raises(Caps.IncorrectTypeException):
+		template.render(*values)
+	with pytest.raises(Caps.IncorrectTypeException):
+		template.renderInto(bytearray(), 0, *values)
+
+def test_render_wrong_binary_and_object():
+	template = CapsTemplate(Caps().writeBinary(b'x').writeObject(Caps()), [0, 1])
+	with pytest.raises(Caps.IncorrectTypeException):
+		template.render('text', Caps())
+	with pytest.raises(Caps.IncorrectTypeException):
+		template.render(b'data', 'not caps')